@@ -0,0 +1,64 @@
+# compare local BOLT11 decoding with DecodePayReq + GetNodeInfo round trips to lnd
+# usage: python benchmarks/bolt11_bench.py [lnd_host:port tls_cert_path admin_macaroon_path]
+# without lnd connection arguments only local decoder is measured, test vectors are mainnet invoices so rpc path needs mainnet lnd
+
+import codecs
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from node import bolt11
+
+# test vectors from BOLT11 specification
+invoices = [
+    "lnbc1pvjluezpp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqdpl2pkx2ctnv5sxxmmwwd5kgetjypeh2ursdae8g6twvus8g6rfwvs8qun0dfjkxaq8rkx3yf5tcsyz3d73gafnh3cax9rn449d9p5uxz9ezhhypd0elx87sjle52x86fux2ypatgddc6k63n7erqz25le42c4u4ecky03ylcqca784w",
+    "lnbc2500u1pvjluezpp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqdq5xysxxatsyp3k7enxv4jsxqzpuaztrnwngzn3kdzw5hydlzf03qdgm2hdq27cqv3agm2awhz5se903vruatfhq77w3ls4evs3ch9zw97j25emudupq63nyw24cg27h2rspfj9srp",
+    "lnbc20m1pvjluezpp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqhp58yjmdan79s6qqdhdzgynm4zwqd5d7xmw5fk98klysy043l2ahrqsfpp3qjmp7lwpagxun9pygexvgpjdc4jdj85fr9yq20q82gphp2nflc7jtzrcazrra7wwgzxqc8u7754cdlpfrmccae92qgzqvzq2ps8pqqqqqqpqqqqq9qqqvpeuqafqxu92d8lr6fvg0r5gv0heeeqgcrqlnm6jhphu9y00rrhy4grqszsvpcgpy9qqqqqqgqqqqq7qqzqj9n4evl6mr5aj9f58zp6fyjzup6ywn3x6sk8akg5v4tgn2q8g4fhx05wf6juaxu9760yp46454gpg5mtzgerlzezqcqvjnhjh8z3g2qqdhhwkj"
+]
+
+
+def local_decode(pay_req):
+    return bolt11.decode(pay_req)
+
+
+def rpc_client(host, cert_path, macaroon_path):
+    import grpc
+    import rpc_pb2 as ln
+    import rpc_pb2_grpc as lnrpc
+
+    os.environ["GRPC_SSL_CIPHER_SUITES"] = "HIGH+ECDSA"
+    with open(cert_path, "rb") as file:
+        cert = file.read()
+    with open(macaroon_path, "rb") as file:
+        macaroon = codecs.encode(file.read(), "hex")
+    auth = grpc.metadata_call_credentials(lambda context, callback: callback([("macaroon", macaroon)], None))
+    creds = grpc.composite_channel_credentials(grpc.ssl_channel_credentials(cert), auth)
+    stub = lnrpc.LightningStub(grpc.secure_channel(host, creds))
+
+    def rpc_decode(pay_req):
+        decoded = stub.DecodePayReq(ln.PayReqString(pay_req=pay_req), timeout=10)
+        try:
+            stub.GetNodeInfo(ln.NodeInfoRequest(pub_key=decoded.destination), timeout=10)
+        except grpc.RpcError:
+            pass  # spec test vectors use unknown node, lookup cost is still measured
+        return decoded
+    return rpc_decode
+
+
+def measure(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for pay_req in invoices:
+            func(pay_req)
+    return (time.perf_counter() - start) / (repeat * len(invoices)) * 1000
+
+
+if __name__ == "__main__":
+    paths = [("local", local_decode, 50)]
+    if len(sys.argv) == 4:
+        paths.append(("rpc", rpc_client(sys.argv[1], sys.argv[2], sys.argv[3]), 10))
+
+    for name, func, repeat in paths:
+        print("  %-6s %8.2f ms per invoice" % (name, measure(func, repeat)))
@@ -0,0 +1,67 @@
+# compare MessageToDict(including_default_value_fields=True) with compact records for ListChannels responses
+# usage: python benchmarks/records_bench.py
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import rpc_pb2 as ln
+from google.protobuf.json_format import MessageToDict
+from node.records import Channel
+
+
+def build_response(num_channels):
+    response = ln.ListChannelsResponse()
+    for i in range(num_channels):
+        ch = response.channels.add()
+        ch.active = i % 7 != 0
+        ch.remote_pubkey = "02" + ("%064x" % (i * 7919))[:64]
+        ch.channel_point = ("%064x" % (i * 104729))[:64] + ":" + str(i % 3)
+        ch.chan_id = 600000 << 40 | i
+        ch.capacity = 1000000 + i
+        ch.local_balance = 400000 + i
+        ch.remote_balance = 590000
+        ch.commit_fee = 9050
+        ch.total_satoshis_sent = i * 1000
+        ch.total_satoshis_received = i * 500
+        ch.num_updates = i * 10
+        ch.csv_delay = 144
+        ch.private = i % 5 == 0
+    return response
+
+
+def convert_dict(response):
+    channels = MessageToDict(response, including_default_value_fields=True)["channels"]
+    # callers converted numeric strings back to int
+    return sum(int(ch["local_balance"]) + int(ch["remote_balance"]) for ch in channels), channels
+
+
+def convert_records(response):
+    channels = [Channel.from_proto(ch) for ch in response.channels]
+    return sum(ch.local_balance + ch.remote_balance for ch in channels), channels
+
+
+def measure(func, response, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(response)
+    cpu_ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    result = func(response)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return cpu_ms, current / 1024, peak / 1024
+
+
+if __name__ == "__main__":
+    for num_channels, repeat in [(1000, 20), (10000, 3)]:
+        response = build_response(num_channels)
+        print("%d channels" % num_channels)
+        for name, func in [("MessageToDict", convert_dict), ("records", convert_records)]:
+            cpu_ms, retained_kb, peak_kb = measure(func, response, repeat)
+            print("  %-14s %9.2f ms  retained %9.1f KiB  peak %9.1f KiB" % (name, cpu_ms, retained_kb, peak_kb))
@@ -0,0 +1,101 @@
+# count userdata.json writes and time spent in UserData setters for typical conversations,
+# with every change written right away (previous behaviour) and with debounced write-behind
+# usage: python benchmarks/userdata_writes.py [number_of_users]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from userdata import UserData
+
+
+def open_channel_conversation(userdata, username, pause):
+    # setter calls made by bot while user goes through /open_channel menu, pause() is called between user messages
+    userdata.delete_open_channel_data(username)
+    userdata.set_conv_state(username, "openChannel")
+    for key, value, state in [("address", "02" + "ab" * 32 + "@127.0.0.1:9735", "openChannel_addr"),
+                              ("local_amount", 2000000, "openChannel_lamount"),
+                              ("target_conf", 6, "openChannel_tconf"),
+                              ("sat_per_byte", 5, "openChannel_fee"),
+                              ("private", False, "openChannel_private"),
+                              ("min_htlc_msat", 1000, "openChannel_minhtlc"),
+                              ("remote_csv_delay", 144, "openChannel_csv")]:
+        pause()
+        userdata.set_conv_state(username, state)
+        pause()
+        userdata.set_open_channel_data(username, key, value)
+        userdata.set_conv_state(username, "openChannel")
+    pause()
+    userdata.set_conv_state(username, "openChannel_execute")
+    userdata.delete_open_channel_data(username)
+    userdata.set_conv_state(username, None)
+
+
+def payment_conversation(userdata, username, pause):
+    # invoice pasted in chat, confirmed and paid
+    userdata.set_wallet_payinvoice(username, {"invoice": "lnbc1...", "decoded": {"num_satoshis": "1000"}})
+    pause()
+    userdata.set_conv_state(username, "payinvoice_otp")
+    pause()
+    userdata.set_wallet_payinvoice(username, None)
+    userdata.set_conv_state(username, None)
+
+
+def run(write_behind, num_users, conversations, user_pause=0):
+    # user_pause is time between user messages, debounce delays are scaled down with it so benchmark runs quickly
+    root_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root_dir, "private"))
+    UserData.root_dir = root_dir
+    UserData.data = {}
+    UserData.write_behind = write_behind
+    if user_pause > 0:
+        UserData.save_delay = user_pause / 2
+        UserData.save_max_delay = user_pause * 5
+    usernames = ["user" + str(i) for i in range(num_users)]
+    userdata = UserData(usernames)
+    writes_start = userdata.writes
+    requests_start = userdata.save_requests
+
+    paused = [0]
+
+    def pause():
+        if user_pause > 0:
+            pause_start = time.perf_counter()
+            time.sleep(user_pause)
+            paused[0] += time.perf_counter() - pause_start
+
+    start = time.perf_counter()
+    for i in range(conversations):
+        username = usernames[i % num_users]
+        open_channel_conversation(userdata, username, pause)
+        payment_conversation(userdata, username, pause)
+    elapsed = time.perf_counter() - start - paused[0]
+    userdata.stop()
+
+    result = {
+        "changes": userdata.save_requests - requests_start,
+        "writes": userdata.writes - writes_start,
+        "setter_ms": elapsed * 1000 / conversations,
+        "file_kb": os.path.getsize(os.path.join(root_dir, "private", "userdata.json")) / 1024
+    }
+    shutil.rmtree(root_dir)
+    return result
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    conversations = 20
+    print("users: " + str(num_users) + ", conversations (open channel + payment): " + str(conversations))
+    for name, write_behind, user_pause in [("write every change", False, 0), ("write-behind, burst", True, 0),
+                                           ("write-behind, paced", True, 0.02)]:
+        result = run(write_behind, num_users, conversations, user_pause)
+        print("%-22s changes/conv %5.1f  writes/conv %5.2f  setters %7.3f ms/conv  userdata.json %.1f KB" % (
+            name, result["changes"] / conversations, result["writes"] / conversations, result["setter_ms"], result["file_kb"]))
+
+
+if __name__ == "__main__":
+    main()
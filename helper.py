@@ -4,8 +4,9 @@ from urllib.parse import urlparse, parse_qs
 
 
 def parse_config(file):
-    config = {"bottoken": "", "botwhitelist": [], "bototp": False, "lnhost": "127.0.0.1", "lnport": 10009, "lnnet": "mainnet", "lndir": "", "lncertpath": "", "lnadminmacaroonpath": "",
-              "scb_on_disk": False, "scb_on_disk_path": ""}
+    config = {"bottoken": "", "botwhitelist": [], "botadmins": [], "bototp": False, "lnhost": "127.0.0.1", "lnport": 10009, "lnnet": "mainnet", "lndir": "", "lncertpath": "", "lnadminmacaroonpath": "",
+              "scb_on_disk": False, "scb_on_disk_path": "", "scb_archive_keep_last": 10, "scb_archive_keep_daily": 7,
+              "scb_archive_keep_weekly": 4, "maxpayments": 5}
 
     try:
         with open(file, "r") as conf_file:
@@ -25,9 +26,9 @@ def parse_config(file):
                     config[param[0]] = True
                 elif param[0] in ["bototp", "scb_on_disk"] and (value == "0" or value.lower() == "false"):
                     config[param[0]] = False
-                elif param[0] in ["lnport"]:
+                elif param[0] in ["lnport", "maxpayments", "scb_archive_keep_last", "scb_archive_keep_daily", "scb_archive_keep_weekly"]:
                     config[param[0]] = int(value)
-                elif param[0] == "botwhitelist":
+                elif param[0] in ["botwhitelist", "botadmins"]:
                     usernames = value.split(",")
                     for user in usernames:
                         if user != "":
@@ -0,0 +1,135 @@
+import os
+import json
+import gzip
+from datetime import datetime, timezone
+from threading import Lock
+from helper import logToFile
+
+
+class BackupArchive:
+
+    # gzip compressed history of multi channel backups, one file per distinct backup, index.log (json lines) lists
+    # archived files so directory is never scanned, retention is applied to index entries whenever backup is added
+
+    index_name = "index.log"
+
+    def __init__(self, directory, keep_last=10, keep_daily=7, keep_weekly=4):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.lock = Lock()
+        self.entries = []  # oldest first
+        self.index_lines = 0
+        try:
+            os.makedirs(directory, exist_ok=True)
+            index_path = os.path.join(directory, self.index_name)
+            if os.path.exists(index_path):
+                with open(index_path, "r") as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # partially written last line
+                        self.index_lines += 1
+                        if record["op"] == "add":
+                            self.entries.append(record["entry"])
+                        elif record["op"] == "remove":
+                            self.entries = [entry for entry in self.entries if entry["file"] != record["file"]]
+        except Exception as e:
+            logToFile("Exception BackupArchive load: " + str(e))
+
+    def add(self, backup_bytes, sha256, fingerprint, num_channels, timestamp=None):
+        # returns archived entry, None if backup is already archived or channels didn't change since last one
+        with self.lock:
+            if len(self.entries) > 0 and self.entries[-1]["fingerprint"] == fingerprint:
+                return None
+            if any(entry["sha256"] == sha256 for entry in self.entries):
+                return None
+            timestamp = int(timestamp if timestamp is not None else datetime.now(timezone.utc).timestamp())
+            time_str = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            entry = {"file": "channel-" + time_str + "-" + sha256[:8] + ".backup.gz", "time": timestamp, "sha256": sha256,
+                     "fingerprint": fingerprint, "channels": num_channels, "size": len(backup_bytes)}
+
+            path = os.path.join(self.directory, entry["file"])
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as file:
+                file.write(gzip.compress(backup_bytes))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+            self.write_index({"op": "add", "entry": entry})
+            self.entries.append(entry)
+            self.prune()
+            return entry
+
+    def retained(self):
+        # must be called with lock held, returns file names kept by retention
+        keep = set()
+        days = []
+        weeks = []
+        for idx, entry in enumerate(reversed(self.entries)):
+            date = datetime.fromtimestamp(entry["time"], timezone.utc)
+            day = date.date()
+            week = date.isocalendar()[:2]
+            if idx < self.keep_last:
+                keep.add(entry["file"])
+            if day not in days and len(days) < self.keep_daily:
+                days.append(day)  # newest backup of each day
+                keep.add(entry["file"])
+            if week not in weeks and len(weeks) < self.keep_weekly:
+                weeks.append(week)  # newest backup of each week
+                keep.add(entry["file"])
+        return keep
+
+    def prune(self):
+        # must be called with lock held, only entries in index are checked
+        keep = self.retained()
+        for entry in [entry for entry in self.entries if entry["file"] not in keep]:
+            try:
+                path = os.path.join(self.directory, entry["file"])
+                if os.path.exists(path):
+                    os.remove(path)
+                self.write_index({"op": "remove", "file": entry["file"]})
+                self.entries.remove(entry)
+            except Exception as e:
+                logToFile("Exception BackupArchive prune: " + str(e))
+        if self.index_lines > 2 * len(self.entries) + 100:
+            self.compact_index()
+
+    def write_index(self, record):
+        # must be called with lock held
+        with open(os.path.join(self.directory, self.index_name), "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.index_lines += 1
+
+    def compact_index(self):
+        # must be called with lock held
+        index_path = os.path.join(self.directory, self.index_name)
+        temp_path = index_path + ".tmp"
+        with open(temp_path, "w") as file:
+            for entry in self.entries:
+                file.write(json.dumps({"op": "add", "entry": entry}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, index_path)
+        self.index_lines = len(self.entries)
+
+    def get_entries(self):
+        # newest first
+        with self.lock:
+            return [dict(entry) for entry in reversed(self.entries)]
+
+    def read(self, file_name):
+        # returns (backup bytes, error)
+        with self.lock:
+            if not any(entry["file"] == file_name for entry in self.entries):
+                return None, "backup not found in archive"
+        try:
+            with open(os.path.join(self.directory, file_name), "rb") as file:
+                return gzip.decompress(file.read()), None
+        except Exception as e:
+            logToFile("Exception BackupArchive read: " + str(e))
+            return None, str(e)
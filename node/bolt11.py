@@ -0,0 +1,308 @@
+import hashlib
+import re
+import time
+
+
+# local BOLT11 invoice decoder, output has the same shape as MessageToDict of lnd PayReq so callers can use either
+
+CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+CHARSET_REV = {c: i for i, c in enumerate(CHARSET)}
+
+# bech32 hrp prefix of invoices and fallback addresses for each network
+networks = {
+    "mainnet": {"hrp": "bc", "p2pkh": 0x00, "p2sh": 0x05},
+    "testnet": {"hrp": "tb", "p2pkh": 0x6f, "p2sh": 0xc4},
+    "regtest": {"hrp": "bcrt", "p2pkh": 0x6f, "p2sh": 0xc4}
+}
+multipliers = {"m": 10 ** 8, "u": 10 ** 5, "n": 10 ** 2, "p": 10 ** -1}  # msat per unit
+hrp_regex = re.compile(r"^ln(bcrt|bc|tb|sb)(\d*)([munp]?)$")
+
+default_expiry = 3600
+default_cltv_expiry = 9
+
+# secp256k1
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+
+def bech32_polymod(values):
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            chk ^= generator[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def bech32_hrp_expand(hrp):
+    return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+
+
+def bech32_decode(text):
+    # invoices are longer than 90 characters so length limit of bech32 addresses is not checked
+    if text.lower() != text and text.upper() != text:
+        raise ValueError("mixed case")
+    text = text.lower()
+    pos = text.rfind("1")
+    if pos < 1 or pos + 7 > len(text):
+        raise ValueError("separator not found")
+    hrp = text[:pos]
+    try:
+        data = [CHARSET_REV[c] for c in text[pos + 1:]]
+    except KeyError:
+        raise ValueError("invalid character")
+    if bech32_polymod(bech32_hrp_expand(hrp) + data) != 1:
+        raise ValueError("invalid checksum")
+    return hrp, data[:-6]
+
+
+def bech32_encode(hrp, data):
+    values = bech32_hrp_expand(hrp) + data
+    polymod = bech32_polymod(values + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + "1" + "".join(CHARSET[d] for d in data + checksum)
+
+
+def convert_bits(data, from_bits, to_bits, pad=True):
+    acc = 0
+    bits = 0
+    result = []
+    maxv = (1 << to_bits) - 1
+    for value in data:
+        acc = (acc << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((acc >> bits) & maxv)
+    if pad and bits:
+        result.append((acc << (to_bits - bits)) & maxv)
+    return result
+
+
+def to_int(data):
+    value = 0
+    for d in data:
+        value = value << 5 | d
+    return value
+
+
+def to_bytes(data):
+    # 5 bit groups to bytes, trailing padding bits are dropped
+    return bytes(convert_bits(data, 5, 8, pad=False))
+
+
+def base58check(payload):
+    alphabet = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+    payload += hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    num = int.from_bytes(payload, "big")
+    result = ""
+    while num > 0:
+        num, rem = divmod(num, 58)
+        result = alphabet[rem] + result
+    return "1" * (len(payload) - len(payload.lstrip(b"\0"))) + result
+
+
+def fallback_address(data, network):
+    version = data[0]
+    program = to_bytes(data[1:])
+    if version <= 16:
+        return bech32_encode(network["hrp"], [version] + convert_bits(program, 8, 5))
+    if version == 17:
+        return base58check(bytes([network["p2pkh"]]) + program)
+    if version == 18:
+        return base58check(bytes([network["p2sh"]]) + program)
+    return ""
+
+
+def route_hint(data):
+    hints = []
+    raw = to_bytes(data)
+    for i in range(0, len(raw) - 50, 51):
+        hop = raw[i:i + 51]
+        hints.append({
+            "node_id": hop[:33].hex(),
+            "chan_id": str(int.from_bytes(hop[33:41], "big")),
+            "fee_base_msat": int.from_bytes(hop[41:45], "big"),
+            "fee_proportional_millionths": int.from_bytes(hop[45:49], "big"),
+            "cltv_expiry_delta": int.from_bytes(hop[49:51], "big")
+        })
+    return {"hop_hints": hints}
+
+
+# elliptic curve math in jacobian coordinates, only needed for pubkey recovery
+
+def jacobian_double(p):
+    x, y, z = p
+    if y == 0:
+        return 0, 0, 0
+    ysq = y * y % P
+    s = 4 * x * ysq % P
+    m = 3 * x * x % P
+    nx = (m * m - 2 * s) % P
+    ny = (m * (s - nx) - 8 * ysq * ysq) % P
+    nz = 2 * y * z % P
+    return nx, ny, nz
+
+
+def jacobian_add(p, q):
+    if p[1] == 0 or p[2] == 0:
+        return q
+    if q[1] == 0 or q[2] == 0:
+        return p
+    z1z1 = p[2] * p[2] % P
+    z2z2 = q[2] * q[2] % P
+    u1 = p[0] * z2z2 % P
+    u2 = q[0] * z1z1 % P
+    s1 = p[1] * z2z2 * q[2] % P
+    s2 = q[1] * z1z1 * p[2] % P
+    if u1 == u2:
+        if s1 != s2:
+            return 0, 0, 1
+        return jacobian_double(p)
+    h = u2 - u1
+    r = s2 - s1
+    h2 = h * h % P
+    h3 = h * h2 % P
+    u1h2 = u1 * h2 % P
+    nx = (r * r - h3 - 2 * u1h2) % P
+    ny = (r * (u1h2 - nx) - s1 * h3) % P
+    nz = h * p[2] * q[2] % P
+    return nx, ny, nz
+
+
+def jacobian_multiply_sum(p, k1, q, k2):
+    # k1*p + k2*q with shared doublings (Shamir's trick)
+    pq = jacobian_add(p, q)
+    result = (0, 0, 1)
+    for i in range(max(k1.bit_length(), k2.bit_length()) - 1, -1, -1):
+        result = jacobian_double(result)
+        bit1 = (k1 >> i) & 1
+        bit2 = (k2 >> i) & 1
+        if bit1 and bit2:
+            result = jacobian_add(result, pq)
+        elif bit1:
+            result = jacobian_add(result, p)
+        elif bit2:
+            result = jacobian_add(result, q)
+    return result
+
+
+def from_jacobian(p):
+    z = pow(p[2], P - 2, P)
+    return p[0] * z * z % P, p[1] * z * z * z % P
+
+
+def recover_pubkey(msg_hash, signature, recovery_id):
+    r = int.from_bytes(signature[:32], "big")
+    s = int.from_bytes(signature[32:64], "big")
+    if not (0 < r < N and 0 < s < N) or recovery_id > 3:
+        raise ValueError("invalid signature")
+    x = r + N if recovery_id & 2 else r
+    if x >= P:
+        raise ValueError("invalid signature")
+    y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+    if (y * y - x * x * x - 7) % P != 0:
+        raise ValueError("invalid signature")
+    if y & 1 != recovery_id & 1:
+        y = P - y
+    e = int.from_bytes(msg_hash, "big")
+    r_inv = pow(r, N - 2, N)
+    # Q = r^-1 * (s*R - e*G)
+    q = jacobian_multiply_sum((x, y, 1), s * r_inv % N, (G[0], G[1], 1), (N - e) * r_inv % N)
+    if q[1] == 0 or q[2] == 0:
+        raise ValueError("invalid signature")
+    qx, qy = from_jacobian(q)
+    return (b"\x03" if qy & 1 else b"\x02") + qx.to_bytes(32, "big")
+
+
+def seconds_to_expiry(decoded, now=None):
+    # decoded is output of decode() or MessageToDict of lnd PayReq, negative when invoice already expired
+    now = time.time() if now is None else now
+    return int(decoded["timestamp"]) + int(decoded["expiry"] or default_expiry) - now
+
+
+def decode(pay_req, net=None):
+    # raises ValueError if invoice is not valid or it is not for given network
+    pay_req = pay_req.strip()
+    if pay_req.lower().startswith("lightning:"):
+        pay_req = pay_req[10:]
+    hrp, data = bech32_decode(pay_req)
+    match = hrp_regex.match(hrp)
+    if match is None:
+        raise ValueError("invalid human readable part")
+    currency, amount, multiplier = match.groups()
+    network = networks.get(net) if net is not None else next((n for n in networks.values() if n["hrp"] == currency), None)
+    if network is None or network["hrp"] != currency:
+        raise ValueError("invoice not for current active network")
+    if len(data) < 7 + 104:
+        raise ValueError("invoice too short")
+
+    amount_msat = 0
+    if amount != "":
+        if multiplier == "":
+            amount_msat = int(amount) * 10 ** 11
+        elif multiplier == "p":
+            if int(amount) % 10 != 0:
+                raise ValueError("invalid sub-millisatoshi amount")
+            amount_msat = int(amount) // 10
+        else:
+            amount_msat = int(amount) * multipliers[multiplier]
+
+    sig_data = data[-104:]
+    data = data[:-104]
+    signature = to_bytes(sig_data)
+    msg_hash = hashlib.sha256(hrp.encode("ascii") + bytes(convert_bits(data, 5, 8))).digest()
+
+    result = {
+        "destination": "",
+        "payment_hash": "",
+        "num_satoshis": str(amount_msat // 1000),
+        "timestamp": str(to_int(data[:7])),
+        "expiry": str(default_expiry),
+        "description": "",
+        "description_hash": "",
+        "fallback_addr": "",
+        "cltv_expiry": str(default_cltv_expiry),
+        "route_hints": []
+    }
+
+    pos = 7
+    while pos + 3 <= len(data):
+        tag = CHARSET[data[pos]]
+        length = data[pos + 1] << 5 | data[pos + 2]
+        field = data[pos + 3:pos + 3 + length]
+        pos += 3 + length
+        if len(field) != length:
+            raise ValueError("invalid field length")
+        # fields with unexpected length are skipped, as required by BOLT11
+        if tag == "p" and length == 52:
+            result["payment_hash"] = to_bytes(field).hex()
+        elif tag == "d":
+            result["description"] = to_bytes(field).decode("utf-8", errors="replace")
+        elif tag == "h" and length == 52:
+            result["description_hash"] = to_bytes(field).hex()
+        elif tag == "n" and length == 53:
+            result["destination"] = to_bytes(field).hex()
+        elif tag == "x":
+            result["expiry"] = str(to_int(field))
+        elif tag == "c":
+            result["cltv_expiry"] = str(to_int(field))
+        elif tag == "f" and length > 0:
+            result["fallback_addr"] = result["fallback_addr"] or fallback_address(field, network)
+        elif tag == "r":
+            result["route_hints"].append(route_hint(field))
+
+    if result["payment_hash"] == "":
+        raise ValueError("invoice without payment hash")
+
+    pubkey = recover_pubkey(msg_hash, signature[:64], signature[64]).hex()
+    if result["destination"] == "":
+        result["destination"] = pubkey
+    elif result["destination"] != pubkey:
+        raise ValueError("invalid invoice signature")
+    return result
+
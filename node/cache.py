@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class TTLCache:
+
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return default
+            if item[0] < monotonic():
+                del self.items[key]  # expired
+                return default
+            self.items.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.items[key] = (expires_at, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)  # evict least recently used
+
+    def update(self, values, ttl=None):
+        # bulk insert, used when warming cache
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            for key, value in values:
+                self.items[key] = (expires_at, value)
+                self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.items.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
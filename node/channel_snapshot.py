@@ -0,0 +1,54 @@
+from time import monotonic
+
+
+class ChannelSnapshot:
+
+    # snapshot is never modified in place, patches return new snapshot so readers can keep iterating old one
+
+    def __init__(self, channels, created=None):
+        self.channels = channels
+        self.created = monotonic() if created is None else created
+
+        # lookup indexes, built once per snapshot
+        self.by_chan_id = {}
+        self.by_channel_point = {}
+        self.by_remote_pubkey = {}
+        for ch in channels:
+            self.by_chan_id[ch.chan_id] = ch
+            self.by_channel_point[ch.channel_point] = ch
+            self.by_remote_pubkey.setdefault(ch.remote_pubkey, []).append(ch)
+
+    def age(self):
+        return monotonic() - self.created
+
+    def get(self, chan_id):
+        try:
+            return self.by_chan_id.get(int(chan_id))
+        except ValueError:
+            return None
+
+    def with_channel(self, channel):
+        if channel.channel_point in self.by_channel_point:
+            channels = [ch for ch in self.channels if ch.channel_point != channel.channel_point]
+        else:
+            channels = list(self.channels)
+        channels.append(channel)
+        return ChannelSnapshot(channels, self.created)
+
+    def without_channel(self, channel_point):
+        if channel_point not in self.by_channel_point:
+            return self
+        channels = [ch for ch in self.channels if ch.channel_point != channel_point]
+        return ChannelSnapshot(channels, self.created)
+
+    def with_active(self, channel_point, active):
+        channel = self.by_channel_point.get(channel_point)
+        if channel is None or channel.active == active:
+            return self
+        channels = []
+        for ch in self.channels:
+            if ch is channel:
+                ch = channel.copy()
+                ch.active = active
+            channels.append(ch)
+        return ChannelSnapshot(channels, self.created)
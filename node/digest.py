@@ -0,0 +1,76 @@
+from helper import logToFile
+from threading import Thread, Condition
+from time import monotonic
+
+
+class Digest:
+
+    # running totals of one window, events themselves are not kept
+
+    __slots__ = ("count", "total", "largest", "memo", "flush_at")
+
+    def __init__(self, flush_at):
+        self.count = 0
+        self.total = 0
+        self.largest = 0
+        self.memo = ""  # first non empty description
+        self.flush_at = flush_at
+
+    def add(self, amount, memo):
+        self.count += 1
+        self.total += amount
+        self.largest = max(self.largest, amount)
+        if self.memo == "":
+            self.memo = memo
+
+
+class DigestAggregator:
+
+    # window starts with first event for a key, flush(key, digest) is called once window ends
+
+    def __init__(self, flush):
+        self.flush = flush
+        self.cond = Condition()
+        self.digests = {}
+        self.stopping = False
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, key, amount, memo, window):
+        with self.cond:
+            digest = self.digests.get(key)
+            if digest is None:
+                digest = self.digests[key] = Digest(monotonic() + window)
+                self.cond.notify()
+            digest.add(amount, memo)
+
+    def run(self):
+        while True:
+            with self.cond:
+                if self.stopping:
+                    return
+                now = monotonic()
+                due = [key for key, digest in self.digests.items() if digest.flush_at <= now]
+                ready = [(key, self.digests.pop(key)) for key in due]
+                if len(ready) == 0:
+                    next_flush = min([digest.flush_at for digest in self.digests.values()], default=None)
+                    self.cond.wait(None if next_flush is None else next_flush - now)
+                    continue
+            self.flush_digests(ready)
+
+    def flush_digests(self, ready):
+        for key, digest in ready:
+            try:
+                self.flush(key, digest)
+            except Exception as e:
+                logToFile("Exception DigestAggregator flush: " + str(e))
+
+    def stop(self):
+        # pending digests are sent right away
+        with self.cond:
+            self.stopping = True
+            ready = list(self.digests.items())
+            self.digests = {}
+            self.cond.notify()
+        self.thread.join(5)
+        self.flush_digests(ready)
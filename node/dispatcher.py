@@ -0,0 +1,241 @@
+from helper import logToFile
+from telegram.error import RetryAfter, NetworkError, BadRequest
+from threading import Lock, Thread, Condition, current_thread
+from collections import deque
+from time import monotonic, sleep
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def reserve(self):
+        # take one token, returns seconds to wait before it may be used
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ChatQueues:
+
+    # queues of chats handled by one worker, chats take turns, chat waiting for retry keeps failed message at its
+    # head and is skipped until retry is due, so later messages to that chat never overtake it
+
+    def __init__(self):
+        self.chats = {}  # chat_id -> deque of items
+        self.ready = deque()  # chats with items that are not waiting for retry
+        self.retry_at = {}  # chat_id -> monotonic time its first item is sent again
+        self.size = 0
+
+    def append(self, item, front=False):
+        chat_id = item[1]
+        queue = self.chats.get(chat_id)
+        if queue is None:
+            queue = self.chats[chat_id] = deque()
+        if front:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+        self.size += 1
+        if len(queue) == 1 and chat_id not in self.retry_at:
+            self.ready.append(chat_id)
+
+    def pop(self):
+        # returns next item, None if no chat is ready
+        self.wake_due()
+        if len(self.ready) == 0:
+            return None
+        chat_id = self.ready.popleft()
+        queue = self.chats[chat_id]
+        item = queue.popleft()
+        self.size -= 1
+        if len(queue) > 0:
+            self.ready.append(chat_id)
+        else:
+            del self.chats[chat_id]
+        return item
+
+    def retry(self, item, due):
+        # item goes back to head of its chat, chat waits until due
+        chat_id = item[1]
+        if chat_id in self.ready:
+            self.ready.remove(chat_id)
+        self.retry_at[chat_id] = due
+        self.chats.setdefault(chat_id, deque()).appendleft(item)
+        self.size += 1
+
+    def wake_due(self):
+        now = monotonic()
+        for chat_id, due in list(self.retry_at.items()):
+            if due <= now:
+                del self.retry_at[chat_id]
+                self.ready.append(chat_id)
+
+    def next_due(self):
+        return min(self.retry_at.values(), default=None)
+
+
+class NotificationDispatcher:
+
+    # notifications are queued by subscription threads and sent by workers, each chat is always handled by the same
+    # worker and has its own queue so messages to one chat keep their order, also when one of them is retried,
+    # telegram limits are kept with per-chat and global token buckets
+
+    chat_rate = 1  # messages per second to one chat
+    chat_burst = 3
+    global_rate = 25  # telegram allows about 30 messages per second overall
+    global_burst = 25
+    max_queue = 5000  # per worker, producers wait when it is full, nothing is dropped
+    retry_base_delay = 2  # failed sends (network errors, telegram 5xx) are retried with exponential backoff
+    retry_max_delay = 600
+    max_attempts = 20
+
+    def __init__(self, bot, outbox=None, workers=4):
+        self.bot = bot
+        self.outbox = outbox  # messages are written to outbox before delivery, pending ones are sent again after restart
+        self.lock = Lock()
+        self.queues = [ChatQueues() for _ in range(workers)]
+        self.conds = [Condition(self.lock) for _ in range(workers)]
+        self.space_cond = Condition(self.lock)  # producers waiting for room in full worker queue
+        self.chat_buckets = {}
+        self.global_bucket = TokenBucket(self.global_rate, self.global_burst)
+        self.paused_until = 0  # set by RetryAfter, flood limit applies to whole bot
+        self.stopping = False
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "blocked": 0, "retry_after": 0, "retried": 0, "max_depth": 0, "throttled_sec": 0.0}
+        self.threads = []
+        for idx in range(workers):
+            t = Thread(target=self.run_worker, args=[idx], daemon=True)
+            self.threads.append(t)
+            t.start()
+
+        if outbox is not None:
+            pending = outbox.get_pending()
+            if len(pending) > 0:
+                logToFile("NotificationDispatcher: sending " + str(len(pending)) + " notifications left in outbox")
+            for entry_id, method, chat_id, kwargs in pending:
+                self.enqueue([method, chat_id, kwargs, None, entry_id, 0])
+
+    def submit(self, method, chat_id, on_done=None, **kwargs):
+        # blocks only while worker queue is full, on_done(result, error) is called from worker thread
+        self.enqueue([method, chat_id, kwargs, on_done, None, 0])
+
+    def send_message(self, chat_id, text, on_done=None, **kwargs):
+        # text notifications are durable, other methods (e.g. documents) are not written to outbox
+        kwargs["text"] = text
+        entry_id = self.outbox.add("send_message", chat_id, kwargs) if self.outbox is not None else None
+        self.enqueue(["send_message", chat_id, kwargs, on_done, entry_id, 0])
+
+    def enqueue(self, item):
+        # item is [method, chat_id, kwargs, on_done, outbox entry id, attempts]
+        idx = hash(item[1]) % len(self.queues)
+        with self.lock:
+            queues = self.queues[idx]
+            if queues.size >= self.max_queue and current_thread() not in self.threads:
+                # producer waits, workers (on_done callbacks queueing follow-up messages) never wait for own queue
+                self.stats["blocked"] += 1
+                self.space_cond.wait_for(lambda: queues.size < self.max_queue or self.stopping)
+            queues.append(item)
+            self.stats["queued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], queues.size)
+            self.conds[idx].notify()
+
+    def finish(self, item, result, error):
+        if item[4] is not None:
+            self.outbox.done(item[4])
+        if item[3] is not None:
+            try:
+                item[3](result, error)
+            except Exception as e:
+                logToFile("Exception NotificationDispatcher on_done: " + str(e))
+
+    def retry_delay(self, attempts):
+        return min(self.retry_max_delay, self.retry_base_delay * (2 ** min(attempts, 16)))
+
+    def reserve(self, chat_id):
+        # must be called with lock held, returns seconds to wait before sending to chat
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return max(bucket.reserve(), self.global_bucket.reserve(), self.paused_until - monotonic())
+
+    def run_worker(self, idx):
+        queues = self.queues[idx]
+        while True:
+            with self.lock:
+                item = queues.pop()
+                while item is None:
+                    if self.stopping:
+                        return  # stopping and queue is drained, items waiting for retry stay in outbox
+                    due = queues.next_due()
+                    self.conds[idx].wait(None if due is None else max(0, due - monotonic()))
+                    item = queues.pop()
+                self.space_cond.notify_all()
+                method, chat_id, kwargs = item[0], item[1], item[2]
+                wait = self.reserve(chat_id)
+                self.stats["throttled_sec"] += wait
+            if wait > 0:
+                sleep(wait)
+
+            result = None
+            error = None
+            try:
+                for value in kwargs.values():
+                    if hasattr(value, "seek"):
+                        value.seek(0)  # file objects (documents) are read to the end by every attempt
+                result = getattr(self.bot, method)(chat_id=chat_id, **kwargs)
+                with self.lock:
+                    self.stats["sent"] += 1
+            except RetryAfter as e:
+                with self.lock:
+                    # pause every worker and send this notification again first
+                    self.paused_until = max(self.paused_until, monotonic() + e.retry_after)
+                    self.stats["retry_after"] += 1
+                    queues.append(item, front=True)
+                continue
+            except Exception as e:
+                error = str(e)
+                # network errors and telegram server errors are temporary, bad requests (e.g. chat not found) are not
+                retry = isinstance(e, NetworkError) and not isinstance(e, BadRequest) and item[5] + 1 < self.max_attempts
+                with self.lock:
+                    if retry:
+                        delay = self.retry_delay(item[5])
+                        item[5] += 1
+                        self.stats["retried"] += 1
+                        queues.retry(item, monotonic() + delay)
+                    else:
+                        self.stats["failed"] += 1
+                logToFile("Exception NotificationDispatcher " + method + " chat_id=" + str(chat_id) + ": " + error +
+                          (", retry in " + str(delay) + " seconds" if retry else ""))
+                if retry:
+                    continue
+
+            self.finish(item, result, error)
+
+    def depth(self):
+        with self.lock:
+            return sum(queues.size for queues in self.queues)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["depth"] = sum(queues.size for queues in self.queues)
+            stats["retry_pending"] = sum(len(queues.retry_at) for queues in self.queues)
+            stats["paused_sec"] = max(0, int(self.paused_until - monotonic()))
+            return stats
+
+    def stop(self, timeout=10):
+        # queued notifications are still sent, unless timeout expires
+        with self.lock:
+            self.stopping = True
+            for cond in self.conds:
+                cond.notify_all()
+            self.space_cond.notify_all()
+        deadline = monotonic() + timeout
+        for t in self.threads:
+            t.join(max(0, deadline - monotonic()))
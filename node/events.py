@@ -0,0 +1,197 @@
+from helper import logToFile
+import threading
+from threading import Thread, Condition
+from collections import deque
+from time import monotonic
+
+
+# typed events published by lnd stream readers, every event keeps monotonic time it was received at
+
+
+class Event:
+
+    __slots__ = ("received",)
+
+    def __init__(self, received=None):
+        self.received = monotonic() if received is None else received
+
+
+class InvoiceSettled(Event):
+
+    __slots__ = ("invoice",)
+
+    def __init__(self, invoice, received=None):
+        super().__init__(received)
+        self.invoice = invoice  # records.Invoice
+
+
+class TxConfirmed(Event):
+
+    # stage is received_unconfirmed, received_confirmed or sent_confirmed, incoming transactions are announced
+    # already when they enter mempool so their first event has no confirmation yet
+
+    __slots__ = ("tx", "stage")
+
+    def __init__(self, tx, stage, received=None):
+        super().__init__(received)
+        self.tx = tx  # records.Transaction
+        self.stage = stage
+
+
+class ChannelOpened(Event):
+
+    __slots__ = ("channel",)
+
+    def __init__(self, channel, received=None):
+        super().__init__(received)
+        self.channel = channel  # records.Channel
+
+
+class ChannelClosed(Event):
+
+    __slots__ = ("remote_pubkey", "channel_point", "capacity", "settled_balance", "closing_tx_hash", "close_type")
+
+    def __init__(self, remote_pubkey, channel_point, capacity, settled_balance, closing_tx_hash, close_type, received=None):
+        super().__init__(received)
+        self.remote_pubkey = remote_pubkey
+        self.channel_point = channel_point
+        self.capacity = capacity
+        self.settled_balance = settled_balance
+        self.closing_tx_hash = closing_tx_hash
+        self.close_type = close_type  # lower case name, e.g. cooperative_close
+
+
+class BackupUpdated(Event):
+
+    # verified multi channel backup, sha256 is hash of backup bytes, fingerprint identifies set of channels in backup,
+    # backup is encrypted with new nonce on every export so snapshots of same channels have different sha256
+
+    __slots__ = ("backup_bytes", "chan_points", "sha256", "fingerprint")
+
+    def __init__(self, backup_bytes, chan_points, sha256, fingerprint, received=None):
+        super().__init__(received)
+        self.backup_bytes = backup_bytes
+        self.chan_points = chan_points
+        self.sha256 = sha256
+        self.fingerprint = fingerprint
+
+
+class NodeStatus(Event):
+
+    # message is notification text for users, empty if status change is not announced
+
+    __slots__ = ("online", "synced", "block_height", "message")
+
+    def __init__(self, online, synced, block_height, message, received=None):
+        super().__init__(received)
+        self.online = online
+        self.synced = synced
+        self.block_height = block_height
+        self.message = message
+
+
+class Subscription:
+
+    # own bounded queue and thread of one consumer, when consumer falls behind oldest events are dropped,
+    # lossless consumer blocks publisher instead, so stream reader slows down to consumer's pace
+
+    def __init__(self, name, handler, event_types, max_queue, lossless=False):
+        self.name = name
+        self.handler = handler
+        self.event_types = event_types
+        self.max_queue = max_queue
+        self.lossless = lossless
+        self.cond = Condition()
+        self.queue = deque()  # (event, threading.Event set when handled or None)
+        self.stopping = False
+        self.stats = {"published": 0, "handled": 0, "failed": 0, "dropped": 0, "blocked": 0, "max_depth": 0}
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, event, handled=None):
+        with self.cond:
+            if len(self.queue) >= self.max_queue:
+                if self.lossless:
+                    self.stats["blocked"] += 1
+                    self.cond.wait_for(lambda: len(self.queue) < self.max_queue or self.stopping)
+                else:
+                    self.queue.popleft()
+                    self.stats["dropped"] += 1
+            self.queue.append((event, handled))
+            self.stats["published"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self.queue))
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.queue) > 0 or self.stopping)
+                if len(self.queue) == 0:
+                    return  # stopping and queue is drained
+                event, handled = self.queue.popleft()
+                self.cond.notify_all()  # wake blocked publishers
+            try:
+                self.handler(event)
+                with self.cond:
+                    self.stats["handled"] += 1
+            except Exception as e:
+                with self.cond:
+                    self.stats["failed"] += 1
+                logToFile("Exception EventBus " + self.name + " " + type(event).__name__ + ": " + str(e))
+            if handled is not None:
+                handled.set()
+
+    def wait_handled(self, handled):
+        # returns early if consumer thread ended (bus stopped) before event was handled
+        while not handled.wait(1):
+            if not self.thread.is_alive():
+                return
+
+    def stop(self, timeout):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def get_stats(self):
+        with self.cond:
+            stats = dict(self.stats)
+            stats["depth"] = len(self.queue)
+            return stats
+
+
+class EventBus:
+
+    # stream readers only publish, each consumer handles events in its own thread, publish blocks only on full
+    # queue of lossless consumer, or when publisher waits for lossless consumers to handle event (wait=True)
+
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, name, handler, event_types=(Event,), max_queue=1000, lossless=False):
+        # handler(event) is called for events that are instances of event_types, in publish order
+        subscription = Subscription(name, handler, tuple(event_types), max_queue, lossless)
+        self.subscriptions = self.subscriptions + [subscription]  # copy, publish iterates without lock
+        return subscription
+
+    def publish(self, event, wait=False):
+        # with wait=True returns after lossless consumers handled event, so their side effects (e.g. outbox entry)
+        # are persisted before publisher commits its own position
+        waiting = []
+        for subscription in self.subscriptions:
+            if isinstance(event, subscription.event_types):
+                handled = threading.Event() if wait and subscription.lossless else None
+                subscription.put(event, handled)
+                if handled is not None:
+                    waiting.append((subscription, handled))
+        for subscription, handled in waiting:
+            subscription.wait_handled(handled)
+
+    def stop(self, timeout=10):
+        # queued events are still handled, unless timeout expires
+        deadline = monotonic() + timeout
+        for subscription in self.subscriptions:
+            subscription.stop(max(0, deadline - monotonic()))
+
+    def get_stats(self):
+        return {subscription.name: subscription.get_stats() for subscription in self.subscriptions}
@@ -0,0 +1,60 @@
+import math
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile of already sorted list
+    if len(sorted_values) == 0:
+        return 0
+    idx = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+class LatencyTracker:
+
+    # rolling window of notification latencies, measured from event receipt (message read from lnd stream)
+    # to render (text ready and queued) and to send (telegram confirmed message), plus notification queue depth
+
+    def __init__(self, window=15*60, max_samples=2000):
+        self.window = window
+        self.max_samples = max_samples
+        self.lock = Lock()
+        self.samples = {}  # (event_type, stage) -> deque of (timestamp, seconds)
+        self.depths = deque(maxlen=max_samples)  # (timestamp, depth)
+
+    def record(self, event_type, stage, received):
+        now = monotonic()
+        with self.lock:
+            key = (event_type, stage)
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.max_samples)
+            self.samples[key].append((now, now - received))
+
+    def record_depth(self, depth):
+        with self.lock:
+            self.depths.append((monotonic(), depth))
+
+    def get_stats(self):
+        # returns {"events": {event_type: {stage: {"count", "p50", "p90", "p99", "max"}}}, "depth": {"max", "avg"}}
+        since = monotonic() - self.window
+        with self.lock:
+            for samples in list(self.samples.values()) + [self.depths]:
+                while len(samples) > 0 and samples[0][0] < since:
+                    samples.popleft()
+            values = {key: sorted(value for _, value in samples) for key, samples in self.samples.items()}
+            depths = [depth for _, depth in self.depths]
+
+        stats = {"events": {}, "depth": {"max": max(depths, default=0), "avg": sum(depths) / len(depths) if len(depths) > 0 else 0}}
+        for (event_type, stage), sorted_values in sorted(values.items()):
+            if len(sorted_values) == 0:
+                continue
+            stats["events"].setdefault(event_type, {})[stage] = {
+                "count": len(sorted_values),
+                "p50": percentile(sorted_values, 50),
+                "p90": percentile(sorted_values, 90),
+                "p99": percentile(sorted_values, 99),
+                "max": sorted_values[-1]
+            }
+        return stats
@@ -6,15 +6,32 @@ import os
 from os.path import join, expandvars, expanduser
 import codecs
 from sys import platform
-from helper import logToFile, formatAmount
-from time import sleep
+from helper import logToFile
 import telegram
-from base64 import b64decode
 import json
-from shutil import copy
-from threading import Lock, Thread
-from copy import deepcopy
+import hashlib
+from threading import Lock, Condition
+from time import monotonic
+from io import BytesIO
 import re
+from node.cache import TTLCache
+from node.channel_snapshot import ChannelSnapshot
+from node.records import Channel, Invoice, Transaction, NodeInfo, channel_point_str
+from node.rpc_invoker import RpcInvoker
+from node.payment_engine import PaymentEngine
+from node import bolt11
+from node.supervisor import SubscriptionSupervisor
+from node.dispatcher import NotificationDispatcher
+from node.outbox import NotificationOutbox
+from node.digest import DigestAggregator
+from node.node_state import NodeState, InvoiceIndex, TxNotificationLog
+from node import renderer
+from node.renderer import NotificationRenderer
+from node.latency import LatencyTracker
+from node.backup_archive import BackupArchive
+from node.events import EventBus, InvoiceSettled, TxConfirmed, ChannelOpened, ChannelClosed, BackupUpdated, NodeStatus
+from userdata import Recipient
+from concurrent.futures import ThreadPoolExecutor
 
 
 class LocalNode:
@@ -35,43 +52,167 @@ class LocalNode:
 
         self.scb_on_disk = config["scb_on_disk"]
         self.scb_on_disk_path = config["scb_on_disk_path"]
+        self.backup_archive = None
+        if self.scb_on_disk and (config["scb_archive_keep_last"] > 0 or config["scb_archive_keep_daily"] > 0 or config["scb_archive_keep_weekly"] > 0):
+            self.backup_archive = BackupArchive(join(os.path.dirname(self.backup_file_path()), "scb_archive"), config["scb_archive_keep_last"],
+                                                config["scb_archive_keep_daily"], config["scb_archive_keep_weekly"])
 
-        self.sub_sleep_retry = 60
-        self.sub_sleep_offline = 30
         self.node_watcher_sleep = 1*60
+        self.not_synced_recheck_delay = 60
+        self.not_synced_recheck = False
+
+        # subscription positions persisted across restarts
+        self.node_state = NodeState(join(self.root_path, "..", "private", "node_state.json"))
+        self.invoice_index = InvoiceIndex(self.node_state)
+        self.invoice_page_size = 100
+        self.tx_log = TxNotificationLog(join(self.root_path, "..", "private", "tx_notified.log"), self.node_state)
+        self.tx_reorg_margin = 6
         self.not_synced_count = -1
 
+        # node aliases, warmed from channel graph and kept current from graph updates
+        self.alias_cache = TTLCache(max_size=100000, ttl=24*60*60)
+        self.alias_cache_miss_ttl = 10*60  # nodes unknown to graph are retried sooner
+
+        # used to run independent RPCs concurrently
+        self.rpc_pool = ThreadPoolExecutor(max_workers=8)
+
+        # channel list kept in memory, patched from channel events, max age is a safety net for balance changes
+        self.channel_snapshot = None
+        self.channel_snapshot_lock = Lock()
+        self.channel_snapshot_max_age = 60
+
+        # keepalive pings detect dead transport without waiting for a failed call
+        self.channel_options = [
+            ("grpc.keepalive_time_ms", 30000),
+            ("grpc.keepalive_timeout_ms", 10000),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+            ("grpc.http2.min_time_between_pings_ms", 30000),
+            ("grpc.max_receive_message_length", 50 * 1024 * 1024)
+        ]
+        self.channel = None
+        self.channel_state = None
+        # channel is rebuilt (cert and macaroon read again) when they change on disk, after repeated failed probes
+        # or when transport stays in TRANSIENT_FAILURE too long
+        self.credential_mtimes = None
+        self.failed_probes = 0
+        self.rebuild_after_failed_probes = 5
+        self.transient_failure_since = None
+        self.rebuild_after_transient_failure = 5*60
+        self.conn_generation = 0  # incremented on every connectivity or online state change
+        self.conn_cond = Condition()
+
         self.stub = None
+        self.invoker = RpcInvoker(lambda: self.stub)
+        # channel balances change with every sent payment
+        self.payment_engine = PaymentEngine(self.invoker, config["maxpayments"], on_payment_done=self.invalidate_channel_snapshot,
+                                            check_request=self.check_payment_request)
+        self.payment_expiry_margin = 10  # seconds, invoice has to stay valid while payment request reaches lnd
+        # notifications are only queued here, dispatcher workers send them
+        self.dispatcher = NotificationDispatcher(bot, NotificationOutbox(join(self.root_path, "..", "private", "outbox.log")))
+        self.renderer = NotificationRenderer()
+        self.latency = LatencyTracker()
+        # stream handlers publish events, notifications are one of the consumers, it is lossless (stream reader waits
+        # for it), backup consumers only need latest backup so they drop oldest events when behind
+        self.events = EventBus()
+        self.events.subscribe("notifications", self.notify_event, lossless=True)
+        if self.scb_on_disk:
+            self.events.subscribe("backup_disk", self.write_backup_file, [BackupUpdated])
+        if self.backup_archive is not None:
+            self.events.subscribe("backup_archive", self.archive_backup, [BackupUpdated])
+        self.invoice_digest = DigestAggregator(self.send_invoice_digest)  # users with digest mode get one message per window
         self.nodeOnline = True
         self.nodeOnline_prev = True
         response = self.check_node_online(init=True)
         self.node_status_output(response)
         self.backup_lock = Lock()
+        self.last_backup_sha256 = None
+        self.supervisor = SubscriptionSupervisor(self)
+
+    def on_connectivity_change(self, state):
+        # called from gRPC internal thread, only record state and wake waiting threads
+        self.channel_state = state
+        if state != grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            self.transient_failure_since = None
+        elif self.transient_failure_since is None:
+            self.transient_failure_since = monotonic()
+        self.notify_conn_change()
+
+    def notify_conn_change(self):
+        with self.conn_cond:
+            self.conn_generation += 1
+            self.conn_cond.notify_all()
+
+    def set_node_online(self, online):
+        self.nodeOnline_prev = self.nodeOnline
+        self.nodeOnline = online
+        if self.nodeOnline_prev != online:
+            self.notify_conn_change()
+
+    def credential_paths(self):
+        if self.ln_cert_path != "" and self.ln_admin_macaroon_path != "":
+            return self.ln_cert_path, self.ln_admin_macaroon_path
+
+        if self.ln_dir != "":
+            lnd_root_dir = self.ln_dir  # custom location
+        else:
+            # default locations
+            if platform.startswith("win32") or platform.startswith("cygwin"):  # windows
+                lnd_root_dir = join(expandvars("%LOCALAPPDATA%"), "Lnd")
+            elif platform.startswith("linux"):  # linux
+                lnd_root_dir = join(expanduser("~"), ".lnd")
+            elif platform.startswith("darwin"):  # macOS
+                lnd_root_dir = join(expanduser("~"), "Library", "Application Support", "Lnd")
+            else:
+                lnd_root_dir = join(self.root_path, "..", "lnd")
 
-    def init_ln_connection(self):
+        return join(lnd_root_dir, "tls.cert"), join(lnd_root_dir, "data", "chain", "bitcoin", self.net, "admin.macaroon")
+
+    def get_credential_mtimes(self):
         try:
-            os.environ["GRPC_SSL_CIPHER_SUITES"] = 'HIGH+ECDSA'
+            return tuple(os.path.getmtime(path) for path in self.credential_paths())
+        except OSError:
+            return None  # files missing (e.g. lnd is regenerating them), keep current channel
+
+    def connection_stale(self):
+        # reason why channel should be rebuilt, None if it is fine
+        mtimes = self.get_credential_mtimes()
+        if mtimes is not None and self.credential_mtimes is not None and mtimes != self.credential_mtimes:
+            return "tls cert or macaroon changed"
+        if self.failed_probes >= self.rebuild_after_failed_probes:
+            return str(self.failed_probes) + " failed probes"
+        since = self.transient_failure_since
+        if since is not None and monotonic() - since >= self.rebuild_after_transient_failure:
+            return "transient failure for " + str(int(monotonic() - since)) + " seconds"
+        return None
+
+    def close_ln_connection(self):
+        channel = self.channel
+        self.channel = None
+        self.channel_state = None
+        self.transient_failure_since = None
+        if channel is not None:
+            try:
+                channel.unsubscribe(self.on_connectivity_change)
+                channel.close()  # open streams fail and are reconnected by supervisor on new channel
+            except Exception as e:
+                logToFile("Exception close_ln_connection: " + str(e))
 
-            if self.ln_cert_path != "" and self.ln_admin_macaroon_path != "":
-                lnd_cert_path = self.ln_cert_path
-                lnd_admin_macaroon_path = self.ln_admin_macaroon_path
-            else:
-                if self.ln_dir != "":
-                    lnd_root_dir = self.ln_dir  # custom location
-                else:
-                    # default locations
-                    if platform.startswith("win32") or platform.startswith("cygwin"):  # windows
-                        lnd_root_dir = join(expandvars("%LOCALAPPDATA%"), "Lnd")
-                    elif platform.startswith("linux"):  # linux
-                        lnd_root_dir = join(expanduser("~"), ".lnd")
-                    elif platform.startswith("darwin"):  # macOS
-                        lnd_root_dir = join(expanduser("~"), "Library", "Application Support", "Lnd")
-                    else:
-                        lnd_root_dir = join(self.root_path, "..", "lnd")
+    def init_ln_connection(self):
+        try:
+            if self.channel is not None:
+                # channel is long-lived, gRPC reconnects transport on its own
+                reason = self.connection_stale()
+                if reason is None:
+                    return
+                logToFile("Rebuilding connection to lnd: " + reason)
+                self.close_ln_connection()
 
-                lnd_cert_path = join(lnd_root_dir, "tls.cert")
-                lnd_admin_macaroon_path = join(lnd_root_dir, "data", "chain", "bitcoin", self.net, "admin.macaroon")
+            os.environ["GRPC_SSL_CIPHER_SUITES"] = 'HIGH+ECDSA'
 
+            lnd_cert_path, lnd_admin_macaroon_path = self.credential_paths()
+            self.credential_mtimes = self.get_credential_mtimes()
+            self.failed_probes = 0
             cert = open(lnd_cert_path, 'rb').read()
             with open(lnd_admin_macaroon_path, 'rb') as f:
                 macaroon_bytes = f.read()
@@ -84,11 +225,15 @@ class LocalNode:
             # combine the cert credentials and the macaroon auth credentials
             combined_creds = grpc.composite_channel_credentials(cert_creds, auth_creds)
 
-            channel = grpc.secure_channel(str(self.ln_host) + ":" + str(self.ln_port), combined_creds)
-            self.stub = lnrpc.LightningStub(channel)
+            self.channel = grpc.secure_channel(str(self.ln_host) + ":" + str(self.ln_port), combined_creds, options=self.channel_options)
+            self.channel.subscribe(self.on_connectivity_change, try_to_connect=True)
+            self.stub = lnrpc.LightningStub(self.channel)
         except Exception as e:
             logToFile("Exception init_ln_connection: " + str(e))
 
+    def get_rpc_stats(self):
+        return self.invoker.format_stats()
+
     def parse_ln_version(self, getinfo_output):
         try:
             if not getinfo_output or "version" not in getinfo_output:
@@ -112,124 +257,148 @@ class LocalNode:
         try:
             if self.nodeOnline is False:
                 return
+            # exported on (re)connect, consumers skip it if channels didn't change since their last backup
+            multi_chan_backup, error = self.export_all_channel_backups()
+            if error is None:
+                self.process_channel_backup(multi_chan_backup)
+        except Exception as e:
+            logToFile("Exception update_channel_backups: " + str(e))
 
-            with self.backup_lock:
-                # get new channel backups
-                response, error = self.export_all_channel_backups()
-                if error is not None:
-                    return
-                new_chan_points = response["multi_chan_backup"]["chan_points"]
-                multi_ch_bytes = b64decode(response["multi_chan_backup"]["multi_chan_backup"])
-                temp_path_local = os.path.join(self.root_path, "..", "temp", "channel.backup")
-                with open(temp_path_local, "wb") as file:
-                    file.write(multi_ch_bytes)
-
-                # read back file and check the integrity of a backup snapshot
-                with open(temp_path_local, "rb") as file:
-                    multi_ch_bytes_check = file.read()
-
-                multi_chan_backup = {
-                    "chan_points": deepcopy(new_chan_points),
-                    "multi_chan_backup": multi_ch_bytes_check
-                }
-                for ch_point in multi_chan_backup["chan_points"]:
-                    ch_point["funding_txid_bytes"] = b64decode(ch_point["funding_txid_bytes"])[:: -1]
+    def process_channel_backup(self, multi_chan_backup):
+        # multi_chan_backup is MultiChanBackup message, backup is verified from memory and same bytes are
+        # passed to all backup consumers (chat, disk)
+        with self.backup_lock:
+            json_out_verify, error = self.verify_chan_backup(multi_chan_backup=multi_chan_backup)
+            msg_verify = "Multi Channel Backup, backup file integrity check failed. "
+            if error is not None:
+                logToFile(msg_verify + str(error))
+                return
+            if json_out_verify:  # if json_out_verify is not empty dict than verification failed
+                logToFile(msg_verify + json.dumps(json_out_verify))
+                return
+            backup_bytes = multi_chan_backup.multi_chan_backup
+            chan_points = sorted(set(channel_point_str(ch_point) for ch_point in multi_chan_backup.chan_points))
+            backup_sha256 = hashlib.sha256(backup_bytes).hexdigest()
+            if backup_sha256 == self.last_backup_sha256:
+                return  # exactly same snapshot was already published
+            self.last_backup_sha256 = backup_sha256
+            fingerprint = hashlib.sha256("\n".join(chan_points).encode()).hexdigest()
+            self.events.publish(BackupUpdated(backup_bytes, chan_points, backup_sha256, fingerprint))
+
+    def backup_file_path(self):
+        if self.scb_on_disk_path != "" and os.path.exists(self.scb_on_disk_path):
+            if os.path.isdir(self.scb_on_disk_path):
+                return join(self.scb_on_disk_path, "channel.backup")
+            return self.scb_on_disk_path
+        return join(self.root_path, "..", "private", "channel.backup")
+
+    def write_backup_file(self, event):
+        # disk consumer of backup events, file is replaced atomically so there is always complete backup on disk
+        path = self.backup_file_path()
+        last = self.node_state.get("backup_disk", {})
+        if last.get("fingerprint") == event.fingerprint and last.get("path") == path and os.path.exists(path):
+            return  # same channels as backup already on disk
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(event.backup_bytes)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+            self.node_state.set("backup_disk", {"fingerprint": event.fingerprint, "path": path})
+        except Exception as e:
+            logToFile("Multi Channel Backup, " + str(e))
+
+    def archive_backup(self, event):
+        entry = self.backup_archive.add(event.backup_bytes, event.sha256, event.fingerprint, len(event.chan_points))
+        if entry is not None:
+            logToFile("Multi Channel Backup archived: " + entry["file"])
+
+    def get_backup_archive(self):
+        # returns (entries newest first, error)
+        if self.backup_archive is None:
+            return None, "backup archive is not enabled"
+        return self.backup_archive.get_entries(), None
+
+    def read_archived_backup(self, file_name):
+        if self.backup_archive is None:
+            return None, "backup archive is not enabled"
+        return self.backup_archive.read(file_name)
+
+    def send_chat_backups(self, recipients, backup_bytes, backup_hash):
+        # recipients is list of (username, chat_id, last_msg_id), backup is uploaded once and other chats get it by
+        # telegram file_id, dispatcher workers send to different chats concurrently
+        for username, chat_id, last_msg_id in recipients:
+            # replace last backup message in chat, messages to one chat are sent in order by dispatcher
+            if last_msg_id is not None:
+                self.dispatcher.submit("delete_message", chat_id, message_id=last_msg_id)
+        self.upload_chat_backup(list(recipients), backup_bytes, backup_hash)
+
+    def upload_chat_backup(self, recipients, backup_bytes, backup_hash):
+        if len(recipients) == 0:
+            return
+        username, chat_id, _ = recipients[0]
+
+        def on_uploaded(new_message, error):
+            if new_message and hasattr(new_message, "message_id"):
+                file_id = new_message.document.file_id
+                self.userdata.set_last_scb_backup(username, new_message.message_id, file_id, backup_hash)
+                for other_username, other_chat_id, _ in recipients[1:]:
+                    self.send_chat_backup(other_username, other_chat_id, file_id, backup_bytes, backup_hash)
+            else:
+                self.upload_chat_backup(recipients[1:], backup_bytes, backup_hash)  # upload failed, try with next chat
 
-                json_out_verify, error = self.verify_chan_backup(multi_chan_backup=multi_chan_backup)
-                msg_verify = "Multi Channel Backup, backup file integrity check failed. "
-                if error is not None:
-                    logToFile(msg_verify + str(error))
-                    return
-                if json_out_verify:  # if json_out_verify is not empty dict than verification failed
-                    logToFile(msg_verify + json.dumps(json_out_verify))
-                    return
+        self.submit_chat_backup(chat_id, BytesIO(backup_bytes), on_uploaded)
 
-                # save file to disk if on disk backups enabled
-                try:
-                    if self.scb_on_disk:
-                        if self.scb_on_disk_path != "" and os.path.exists(self.scb_on_disk_path):
-                            copy(temp_path_local, self.scb_on_disk_path)
-                        else:
-                            copy(temp_path_local, join(self.root_path, "..", "private"))
-                except Exception as e:
-                    logToFile("Multi Channel Backup, " + str(e))
-
-                for username in self.userdata.get_usernames():
-                    chat_id = self.userdata.get_chat_id(username)
-                    backups_state = self.userdata.get_backups_state(username)
-
-                    if chat_id is not None and backups_state["chatscb"] is True:
-                        send_new_backup = True
-
-                        if backups_state["last_scb_backup_msg_id"] is not None and backups_state["last_scb_backup_file_id"] is not None:
-                            old_chan_points = backups_state["last_scb_backup_chan_points"]
-                            if len(new_chan_points) == len(old_chan_points):
-                                intersection = [ch_point for ch_point in old_chan_points if ch_point in new_chan_points]
-                                if len(intersection) == len(old_chan_points):
-                                    send_new_backup = False  # don't send new backup, channels are the same as last time
-
-                        if send_new_backup:
-                            # delete last backup message
-                            if backups_state["last_scb_backup_msg_id"] is not None:
-                                try:
-                                    self.bot.delete_message(chat_id=chat_id, message_id=backups_state["last_scb_backup_msg_id"])
-                                except Exception as e:
-                                    logToFile("Multi Channel Backup, last backup message cannot be deleted. (probably more than 48h from last message) user=" + str(username))
-                            # send new backup file
-                            caption_text = "<b>Multi Channel Backup</b>"
-                            new_message = self.bot.send_document(chat_id=chat_id, document=open(temp_path_local, "rb"), parse_mode=telegram.ParseMode.HTML,
-                                                                 caption=caption_text, filename="channel.backup", disable_notification=True)
-                            # save new backup message data
-                            if new_message and hasattr(new_message, "message_id"):
-                                self.userdata.set_last_scb_backup_msg_id(username, new_message.message_id)
-                                self.userdata.set_last_scb_backup_file_id(username, new_message.document.file_id)
-                                self.userdata.set_last_scb_backup_chan_points(username, new_chan_points)
-
-                if os.path.exists(temp_path_local):
-                    os.remove(temp_path_local)
+    def send_chat_backup(self, username, chat_id, file_id, backup_bytes, backup_hash):
+        def on_sent(new_message, error):
+            if new_message and hasattr(new_message, "message_id"):
+                self.userdata.set_last_scb_backup(username, new_message.message_id, new_message.document.file_id, backup_hash)
+            elif file_id is not None:
+                self.send_chat_backup(username, chat_id, None, backup_bytes, backup_hash)  # file_id not accepted, upload bytes
 
-        except Exception as e:
-            logToFile("Exception update_channel_backups: " + str(e))
+        self.submit_chat_backup(chat_id, file_id if file_id is not None else BytesIO(backup_bytes), on_sent)
+
+    def submit_chat_backup(self, chat_id, document, on_done):
+        caption_text = "<b>Multi Channel Backup</b>"
+        self.dispatcher.submit("send_document", chat_id, on_done=on_done, document=document, parse_mode=telegram.ParseMode.HTML,
+                               caption=caption_text, filename="channel.backup", disable_notification=True)
 
-    def check_node_online(self, init=False, wait_on_not_synced=-1):
+    def check_node_online(self, init=False, defer_not_synced=False):
         try:
-            first = True
-            while True:
-                if self.nodeOnline is False or init is True:
-                    self.init_ln_connection()  # initialize gRPC
+            self.init_ln_connection()  # initialize gRPC, or rebuild stale channel
 
-                lninfo, err_ln_getinfo = self.get_ln_info(log_enabled=False)
-                self.parse_ln_version(lninfo)
-                self.nodeOnline_prev = self.nodeOnline
+            lninfo, err_ln_getinfo = self.get_ln_info(log_enabled=False, retries=0)  # node watcher probe, no retries
+            self.parse_ln_version(lninfo)
 
-                if err_ln_getinfo is not None:
-                    self.nodeOnline = False
+            if err_ln_getinfo is not None:
+                self.failed_probes += 1
+                self.set_node_online(False)
+                self.not_synced_count = -1
+                return {"online": False, "msg": err_ln_getinfo}
+            else:
+                self.failed_probes = 0
+                if lninfo["synced_to_chain"] is False and defer_not_synced:
+                    return {"online": True, "recheck": True}  # online state is set after recheck
+                self.set_node_online(True)
+                if lninfo["synced_to_chain"] is True:
                     self.not_synced_count = -1
-                    return {"online": False, "msg": err_ln_getinfo}
-                else:
-                    if first and lninfo["synced_to_chain"] is False and wait_on_not_synced > 0:
-                        first = False
-                        # wait and check again, to prevent false positives on slow hardware
-                        # lightning node 1 block behind, when checking
-                        sleep(wait_on_not_synced)
-                        continue
-                    self.nodeOnline = True
-                    if lninfo["synced_to_chain"] is True:
-                        self.not_synced_count = -1
-                    return {
-                        "online": True,
-                        "block_height": lninfo["block_height"],
-                        "synced": lninfo["synced_to_chain"],
-                        "version": lninfo["version"]
-                    }
+                return {
+                    "online": True,
+                    "block_height": lninfo["block_height"],
+                    "synced": lninfo["synced_to_chain"],
+                    "version": lninfo["version"]
+                }
         except Exception as e:
             text = str(e)
             logToFile("Exception check_node_online: " + text)
-            self.nodeOnline = False
+            self.failed_probes += 1
+            self.set_node_online(False)
             self.not_synced_count = -1
             return {"online": None, "msg": "Exception: " + text}
 
     def node_status_output(self, response):
+        received = monotonic()
         try:
             text = ""
             if response["online"] is False and self.nodeOnline_prev is True:
@@ -242,60 +411,95 @@ class LocalNode:
                 elif self.nodeOnline_prev is False:
                     text = "Lightning node is online."
 
-            if text != "":
-                for username in self.userdata.get_usernames():
-                    chat_id = self.userdata.get_chat_id(username)
-                    if chat_id is not None and self.userdata.get_notifications_state(username)["node"] is True:
-                        self.bot.send_message(chat_id=chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
+            self.events.publish(NodeStatus(response["online"], response.get("synced"), response.get("block_height"), text, received))
 
         except Exception as e:
             logToFile("Exception LocalNode node_status_output: " + str(e))
 
-    def subscribe_node_watcher(self):
-        try:
-            while True:
-                response = self.check_node_online(wait_on_not_synced=60)
-                self.node_status_output(response)
-                sleep(self.node_watcher_sleep)
-
-        except Exception as e:
-            logToFile("Exception LiveFeed LocalNode subscribe_node_watcher: " + str(e))
+    def watch_node(self):
+        # one node watcher check, called by subscription supervisor, returns seconds until next check
+        if self.not_synced_recheck:
+            self.not_synced_recheck = False
+            response = self.check_node_online()
+        else:
+            response = self.check_node_online(defer_not_synced=True)
+            if response.get("recheck"):
+                # check again later, to prevent false positives on slow hardware lightning node 1 block behind
+                self.not_synced_recheck = True
+                return self.not_synced_recheck_delay
+        self.node_status_output(response)
+        return self.node_watcher_sleep
 
-    def decode_ln_invoice(self, pay_req):
+    def decode_ln_invoice(self, pay_req, local=True):
+        # invoices are decoded locally, lnd is only asked when local decoder rejects invoice
+        if local:
+            try:
+                return bolt11.decode(pay_req, net=self.net), None
+            except Exception as e:
+                if not self.nodeOnline:
+                    return None, str(e)
         try:
             request = ln.PayReqString(pay_req=pay_req)
-            response = self.stub.DecodePayReq(request)
+            response = self.invoker.call("DecodePayReq", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception decode_ln_invoice: " + text)
             return None, text
 
     def get_ln_node_info(self, pub_key):
         try:
             request = ln.NodeInfoRequest(pub_key=pub_key)
-            response = self.stub.GetNodeInfo(request)
-            return MessageToDict(response, including_default_value_fields=True), None
+            response = self.invoker.call("GetNodeInfo", request)
+            return NodeInfo.from_proto(response), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception get_ln_node_info: " + text)
             return None, text
 
-    def get_ln_info(self, log_enabled=True):
+    def describe_graph_aliases(self):
+        try:
+            response = self.invoker.call("DescribeGraph", ln.ChannelGraphRequest(include_unannounced=True))
+            # read fields directly, converting whole graph to dict would be too expensive
+            return [(node.pub_key, node.alias) for node in response.nodes], None
+        except Exception as e:
+            text = str(e)
+            logToFile("Exception describe_graph_aliases: " + text)
+            return None, text
+
+    def warm_alias_cache(self):
+        aliases, error = self.describe_graph_aliases()
+        if error is None:
+            self.alias_cache.update(aliases)
+
+    def get_node_alias(self, pub_key, cached_only=False):
+        # returns node alias or empty string if alias is not known
+        alias = self.alias_cache.get(pub_key)
+        if alias is not None or cached_only:
+            return alias if alias is not None else ""
+
+        info_data, error_info = self.get_ln_node_info(pub_key=pub_key)
+        if info_data is None:
+            self.alias_cache.set(pub_key, "", ttl=self.alias_cache_miss_ttl)
+            return ""
+        alias = info_data.alias
+        self.alias_cache.set(pub_key, alias)
+        return alias
+
+    def get_node_aliases(self, pub_keys):
+        # resolve aliases for list of nodes, cache misses are looked up concurrently
+        aliases = {pub_key: self.get_node_alias(pub_key, cached_only=True) for pub_key in pub_keys}
+        missing = [pub_key for pub_key, alias in aliases.items() if alias == "" and self.alias_cache.get(pub_key) is None]
+        for pub_key, alias in zip(missing, self.rpc_pool.map(self.get_node_alias, missing)):
+            aliases[pub_key] = alias
+        return aliases
+
+    def get_ln_info(self, log_enabled=True, retries=None):
         try:
-            response = self.stub.GetInfo(ln.GetInfoRequest())
+            response = self.invoker.call("GetInfo", ln.GetInfoRequest(), retries=retries)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             if log_enabled:
                 logToFile("Exception get_ln_info: " + text)
             return None, text
@@ -307,13 +511,10 @@ class LocalNode:
             else:
                 addr_type = "NESTED_PUBKEY_HASH"
             request = ln.NewAddressRequest(type=addr_type)
-            response = self.stub.NewAddress(request)
+            response = self.invoker.call("NewAddress", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception get_ln_onchain_address: " + text)
             return None, text
 
@@ -329,65 +530,102 @@ class LocalNode:
                 args["send_all"] = True
 
             request = ln.SendCoinsRequest(**args)
-            response = self.stub.SendCoins(request)
+            response = self.invoker.call("SendCoins", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception send_coins: " + text)
             return None, text
 
-    def pay_ln_invoice(self, pay_req):
-        try:
-            request = ln.SendRequest(payment_request=pay_req)
-            response = self.stub.SendPaymentSync(request)
-            return MessageToDict(response, including_default_value_fields=True), None
-        except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
-            logToFile("Exception pay_ln_invoice: " + text)
-            return None, text
+    def check_payment_request(self, pay_req):
+        # returns reason why lnd would reject payment request, lnd rejects it without payment hash so it must be
+        # caught before request is sent to shared payment stream
+        decoded, error = self.decode_ln_invoice(pay_req)
+        if error is not None:
+            return "invalid invoice, " + error
+        if int(decoded["num_satoshis"]) == 0:
+            return "invoice without amount"
+        if bolt11.seconds_to_expiry(decoded) < self.payment_expiry_margin:
+            return "invoice expired"
+        return None
+
+    def pay_ln_invoice(self, pay_req, payment_hash, on_progress, on_done):
+        # non-blocking, on_progress(state, queue_position) and on_done(result, error) are called from engine threads
+        self.payment_engine.pay(pay_req, payment_hash, on_progress, on_done)
 
     def add_ln_invoice(self, value_sats, memo, expiry_sec):
         try:
             request = ln.Invoice(memo=memo, value=int(value_sats), expiry=int(expiry_sec))
-            response = self.stub.AddInvoice(request)
+            response = self.invoker.call("AddInvoice", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception add_ln_invoice: " + text)
             return None, text
 
-    def get_channel_list(self):
+    def get_channel_snapshot(self, use_cache=True):
+        # returned snapshot is shared and must not be modified by callers
         try:
-            channels = self.stub.ListChannels(ln.ListChannelsRequest())
-            return MessageToDict(channels, including_default_value_fields=True), None
+            snapshot = self.channel_snapshot
+            if use_cache and snapshot is not None and snapshot.age() < self.channel_snapshot_max_age:
+                return snapshot, None
+
+            with self.channel_snapshot_lock:
+                snapshot = self.channel_snapshot
+                if use_cache and snapshot is not None and snapshot.age() < self.channel_snapshot_max_age:
+                    return snapshot, None  # refreshed by other thread meanwhile
+
+                channels = self.invoker.call("ListChannels", ln.ListChannelsRequest())
+                snapshot = ChannelSnapshot([Channel.from_proto(ch) for ch in channels.channels])
+                self.channel_snapshot = snapshot
+            return snapshot, None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
-            logToFile("Exception get_channel_list: " + text)
+            text = str(e)
+            logToFile("Exception get_channel_snapshot: " + text)
             return None, text
 
+    def get_channel_list(self, use_cache=True):
+        snapshot, error = self.get_channel_snapshot(use_cache)
+        if error is not None:
+            return None, error
+        return {"channels": snapshot.channels}, None
+
+    def get_channel(self, chan_id):
+        snapshot, error = self.get_channel_snapshot()
+        if error is not None:
+            return None, error
+        return snapshot.get(chan_id), None
+
+    def invalidate_channel_snapshot(self):
+        with self.channel_snapshot_lock:
+            self.channel_snapshot = None
+
+    def patch_channel_snapshot(self, event):
+        try:
+            with self.channel_snapshot_lock:
+                snapshot = self.channel_snapshot
+                if snapshot is None:
+                    return
+                if event.type == ln.ChannelEventUpdate.OPEN_CHANNEL:
+                    self.channel_snapshot = snapshot.with_channel(Channel.from_proto(event.open_channel))
+                elif event.type == ln.ChannelEventUpdate.CLOSED_CHANNEL:
+                    self.channel_snapshot = snapshot.without_channel(event.closed_channel.channel_point)
+                elif event.type == ln.ChannelEventUpdate.ACTIVE_CHANNEL:
+                    self.channel_snapshot = snapshot.with_active(channel_point_str(event.active_channel), True)
+                elif event.type == ln.ChannelEventUpdate.INACTIVE_CHANNEL:
+                    self.channel_snapshot = snapshot.with_active(channel_point_str(event.inactive_channel), False)
+        except Exception as e:
+            logToFile("Exception patch_channel_snapshot: " + str(e))
+            self.channel_snapshot = None
+
     def connect_peer(self, pubkey, host):
         try:
             addr = ln.LightningAddress(pubkey=pubkey, host=host)
             request = ln.ConnectPeerRequest(addr=addr)
-            response = self.stub.ConnectPeer(request)
+            response = self.invoker.call("ConnectPeer", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception connect_peer: " + text)
             return None, text
 
@@ -403,13 +641,11 @@ class LocalNode:
                 args["remote_csv_delay"] = remote_csv_delay
 
             request = ln.OpenChannelRequest(**args)
-            response = self.stub.OpenChannelSync(request)
+            response = self.invoker.call("OpenChannelSync", request)
+            self.invalidate_channel_snapshot()
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception open_channel: " + text)
             return None, text
 
@@ -426,45 +662,46 @@ class LocalNode:
                 args["target_conf"] = target_conf
 
             request = ln.CloseChannelRequest(**args)
-            for response in self.stub.CloseChannel(request):
+            call = self.invoker.stream("CloseChannel", request)
+            for response in self.invoker.iterate("CloseChannel", call):
+                self.invalidate_channel_snapshot()
                 ret = MessageToDict(response, including_default_value_fields=True)
                 return ret, None  # return after close_pending received
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception close_channel: " + text)
             return None, text
 
     def get_balance_report(self):
         try:
-            onchain_wallet = self.stub.WalletBalance(ln.WalletBalanceRequest())
-            channels = self.stub.ListChannels(ln.ListChannelsRequest())
+            # start all requests at once, report takes as long as the slowest one
+            onchain_future = self.rpc_pool.submit(self.invoker.call, "WalletBalance", ln.WalletBalanceRequest())
+            ch_balance_future = self.rpc_pool.submit(self.invoker.call, "ChannelBalance", ln.ChannelBalanceRequest())
+            pending_future = self.rpc_pool.submit(self.invoker.call, "PendingChannels", ln.PendingChannelsRequest())
+            snapshot, error = self.get_channel_snapshot()
+            if error is not None:
+                return None, error
 
             response = {
-                "onchain": MessageToDict(onchain_wallet, including_default_value_fields=True),
-                "ln": MessageToDict(channels, including_default_value_fields=True)
+                "onchain": MessageToDict(onchain_future.result(), including_default_value_fields=True),
+                "ln": snapshot,
+                "ln_balance": MessageToDict(ch_balance_future.result(), including_default_value_fields=True),
+                "pending": MessageToDict(pending_future.result(), including_default_value_fields=True)
             }
             return response, None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception get_balance_report: " + text)
             return None, text
 
     def export_all_channel_backups(self):
+        # returns MultiChanBackup message, backup bytes are in multi_chan_backup field
         try:
             request = ln.ChanBackupExportRequest()
-            response = self.stub.ExportAllChannelBackups(request)
-            return MessageToDict(response, including_default_value_fields=True), None
+            response = self.invoker.call("ExportAllChannelBackups", request)
+            return response.multi_chan_backup, None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception export_all_channel_backups: " + text)
             return None, text
 
@@ -478,264 +715,263 @@ class LocalNode:
                 request = ln.ChanBackupSnapshot(multi_chan_backup=multi_chan_backup)
             else:
                 request = ln.ChanBackupSnapshot(single_chan_backups=single_chan_backups)
-            response = self.stub.VerifyChanBackup(request)
+            response = self.invoker.call("VerifyChanBackup", request)
             return MessageToDict(response, including_default_value_fields=True), None
         except Exception as e:
-            if hasattr(e, "_state") and hasattr(e._state, "details"):
-                text = str(e._state.details)
-            else:
-                text = str(e)
+            text = str(e)
             logToFile("Exception verify_chan_backup: " + text)
             return None, text
 
-    def subscribe_invoices(self):
-
-        while True:
-            if not self.nodeOnline:
-                sleep(self.sub_sleep_offline)  # if we know node is offline, sleep and retry
-                continue
-
-            try:
-                request = ln.InvoiceSubscription()
-                for response in self.stub.SubscribeInvoices(request):
-                    json_out = MessageToDict(response, including_default_value_fields=True)
-                    # received payment
-                    if "settled" in json_out and json_out["settled"] is True:
-                        text = "<b>Received LN payment.</b>\n"
-                        text += "Amount: {0}\n"
-                        if "memo" in json_out and json_out["memo"] != "":
-                            text += "Description: " + json_out["memo"]
-
-                        # send to each user that have chat_id in userdata
-                        for username in self.userdata.get_usernames():
-                            chat_id = self.userdata.get_chat_id(username)
-                            if chat_id is not None and self.userdata.get_notifications_state(username)["invoices"] is True:
-                                unit = self.userdata.get_selected_unit(username)
-                                text = text.format(formatAmount(int(json_out["amt_paid_sat"]), unit))
-                                self.bot.send_message(chat_id=chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
-
-            except Exception as e:
-                msg = "LiveFeed LocalNode subscribe invoices: connection lost, will retry after " + str(self.sub_sleep_retry) + " seconds"
-                logToFile(msg)
-                sleep(self.sub_sleep_retry)
-
-    def subscribe_channel_events(self):
-
-        while True:
-            if not self.nodeOnline:
-                sleep(self.sub_sleep_offline)  # if we know node is offline, sleep and retry
-                continue
-
-            if self.ln_version["major"] == 0 and self.ln_version["minor"] < 6:
+    def supports_backup_streams(self):
+        # channel events and backup subscriptions need lnd 0.6 or newer
+        return not (self.ln_version["major"] == 0 and self.ln_version["minor"] < 6)
+
+    def invoice_subscription(self):
+        # lnd replays invoices added or settled after these indexes
+        return ln.InvoiceSubscription(add_index=self.invoice_index.add_index, settle_index=self.invoice_index.settle_index)
+
+    def start_invoices_stream(self):
+        first_start = self.invoice_index.is_empty()
+        if first_start or not self.invoice_index.has_settle_index():
+            # remember where invoice history ends, settlements are resumed from highest settle_index of recent invoices
+            response = self.invoker.call("ListInvoices", ln.ListInvoiceRequest(reversed=True, num_max_invoices=self.invoice_page_size))
+            self.invoice_index.seed(max([invoice.add_index for invoice in response.invoices], default=0),
+                                    max([invoice.settle_index for invoice in response.invoices], default=0))
+            if first_start:
                 return
 
-            try:
-                request = ln.ChannelEventSubscription()
-                for response in self.stub.SubscribeChannelEvents(request):
-                    json_out = MessageToDict(response, including_default_value_fields=True)
-                    text = ""
-                    if "type" in json_out and json_out["type"] == "OPEN_CHANNEL":
-                        channel_data = json_out["open_channel"]
-                        total = int(channel_data["local_balance"]) + int(channel_data["remote_balance"])
-                        channel_data["local_balance_pct"] = int(round((int(channel_data["local_balance"]) / total) * 100))
-                        channel_data["remote_balance_pct"] = int(round((int(channel_data["remote_balance"]) / total) * 100))
-
-                        initiator = "by us can now be used" if channel_data["initiator"] else "by remote peer"
-                        text = "<b>New channel opened "+initiator+"</b>\n"
-                        node_name = channel_data["remote_pubkey"]
-
-                        info_data, error_info = self.get_ln_node_info(pub_key=channel_data["remote_pubkey"])
-                        if info_data is not None and info_data["node"]["alias"] != "":
-                            node_name = info_data["node"]["alias"]
-
-                        text += "<a href='{5}" + channel_data["remote_pubkey"] + "'>" + node_name + "</a>\n"
-                        text += "Capacity: {0}\n"
-                        text += "Local Balance: {1} ("+str(channel_data["local_balance_pct"])+"%)\n"
-                        text += "Remote Balance: {2} ("+str(channel_data["remote_balance_pct"])+"%)\n"
-                        text += "Time Lock: " + str(channel_data["csv_delay"]) + "\n"
-                        private = "yes" if channel_data["private"] else "no"
-                        text += "Private: " + private + "\n"
-                        fund_txid = channel_data["channel_point"][:channel_data["channel_point"].find(':')]
-                        text += "Txid: <a href='{3}" + fund_txid + "'>" + fund_txid[:8] + "..." + fund_txid[-8:] + "</a>\n"
-
-                    elif "type" in json_out and json_out["type"] == "CLOSED_CHANNEL":
-                        channel_data = json_out["closed_channel"]
-                        text = "<b>Channel closed</b>\n"
-                        node_name = channel_data["remote_pubkey"]
-
-                        info_data, error_info = self.get_ln_node_info(pub_key=channel_data["remote_pubkey"])
-                        if info_data is not None and info_data["node"]["alias"] != "":
-                            node_name = info_data["node"]["alias"]
-
-                        text += "<a href='{5}" + channel_data["remote_pubkey"] + "'>" + node_name + "</a>\n"
-                        text += "Capacity: {0}\n"
-                        text += "Settled Balance: {4}\n"
-                        text += "Txid: <a href='{3}" + channel_data["closing_tx_hash"] + "'>"+channel_data["closing_tx_hash"][:8]+"..."+channel_data["closing_tx_hash"][-8:]+"</a>\n"
-                        text += "Closure Type: " + str(channel_data["close_type"]).lower()
-
-                    if text != "":
-                        local_balance = int(channel_data["local_balance"]) if "local_balance" in channel_data else 0
-                        remote_balance = int(channel_data["remote_balance"]) if "remote_balance" in channel_data else 0
-                        settled_balance = int(channel_data["settled_balance"]) if "settled_balance" in channel_data else 0
-
-                        for username in self.userdata.get_usernames():
-                            chat_id = self.userdata.get_chat_id(username)
-                            if chat_id is not None and self.userdata.get_notifications_state(username)["chevents"] is True:
-                                unit = self.userdata.get_selected_unit(username)
-                                explorerLink = self.userdata.get_default_explorer(username)
-                                searchEngineLink = self.userdata.get_default_node_search_link(username)
-                                text = text.format(
-                                    formatAmount(int(channel_data["capacity"]), unit),
-                                    formatAmount(local_balance, unit),
-                                    formatAmount(remote_balance, unit),
-                                    explorerLink,
-                                    formatAmount(settled_balance, unit),
-                                    searchEngineLink
-                                )
-                                self.bot.send_message(chat_id=chat_id, text=text, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
-
-            except Exception as e:
-                msg = "LiveFeed LocalNode subscribe channel events: connection lost, will retry after " + str(self.sub_sleep_retry) + " seconds"
-                logToFile(msg)
-                sleep(self.sub_sleep_retry)
-
-    def subscribe_transactions(self):
-
+        # invoices added while stream was down, paged from last seen add_index so invoice DB is never rescanned
+        index_offset = self.invoice_index.add_index
         while True:
-            if not self.nodeOnline:
-                sleep(self.sub_sleep_offline)  # if we know node is offline, sleep and retry
-                continue
-
-            try:
-                cache_tx = {}
-                request = ln.GetTransactionsRequest()
-                for response in self.stub.SubscribeTransactions(request):
-                    json_out = MessageToDict(response, including_default_value_fields=True)
-                    amount = int(json_out["amount"])
-                    if amount > 0:
-                        if json_out["num_confirmations"] == 0 and json_out["tx_hash"] not in cache_tx:
-                            cache_tx[json_out["tx_hash"]] = json_out["num_confirmations"]
-                            text = "<b>Unconfirmed incoming transaction</b>\n"
-                        elif json_out["num_confirmations"] >= 1 and json_out["tx_hash"] not in cache_tx:
-                            cache_tx[json_out["tx_hash"]] = json_out["num_confirmations"]
-                            text = "<b>Received funds confirmed</b>\n"
-                        else:
-                            cache_tx.pop(json_out["tx_hash"], None)
-                            continue  # ignore duplicate
-                    elif amount < 0 and json_out["num_confirmations"] >= 1:
-                        if json_out["tx_hash"] in cache_tx:
-                            cache_tx.pop(json_out["tx_hash"], None)
-                            continue  # ignore duplicate
-                        else:
-                            cache_tx[json_out["tx_hash"]] = json_out["num_confirmations"]
-                        text = "<b>Sent transaction confirmed</b>\n"
-                        amount = abs(amount)
-                    else:
-                        continue
-
-                    text += "Amount: {0}\n"
-                    total_fees = int(json_out["total_fees"])
-                    if total_fees > 0:
-                        text += "Fees: {1}\n"
-                    conf = json_out["num_confirmations"]
-                    if conf > 0:
-                        text += "Confirmations: " + str(conf) + "\n"
-                    text += "Txid: <a href='{2}" + json_out["tx_hash"] + "'>" + json_out["tx_hash"][:8] + "..."+ json_out["tx_hash"][-8:] +"</a>\n"
-
-                    # send to each user that have chat_id in userdata
-                    for username in self.userdata.get_usernames():
-                        chat_id = self.userdata.get_chat_id(username)
-                        if chat_id is not None and self.userdata.get_notifications_state(username)["transactions"] is True:
-                            unit = self.userdata.get_selected_unit(username)
-                            explorerLink = self.userdata.get_default_explorer(username)
-                            text = text.format(formatAmount(amount, unit), formatAmount(total_fees, unit), explorerLink)
-                            self.bot.send_message(chat_id=chat_id, text=text, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
-
-            except Exception as e:
-                msg = "LiveFeed LocalNode subscribe transactions: connection lost, will retry after " + str(self.sub_sleep_retry) + " seconds"
-                logToFile(msg)
-                sleep(self.sub_sleep_retry)
-
-    def subscribe_channel_backups(self):
-
-        while True:
-            if not self.nodeOnline:
-                sleep(self.sub_sleep_offline)
-                continue
-
-            if self.ln_version["major"] == 0 and self.ln_version["minor"] < 6:
-                return
-
-            try:
-                # check if channel backups exists if not or not updated, save or send new backup file
-                Thread(target=self.update_channel_backups, daemon=True).start()
-
-                request = ln.ChannelBackupSubscription()
-                for response in self.stub.SubscribeChannelBackups(request):
-                    json_out = MessageToDict(response, including_default_value_fields=True)
-                    new_chan_points = json_out["multi_chan_backup"]["chan_points"]
-                    multi_ch_bytes = b64decode(json_out["multi_chan_backup"]["multi_chan_backup"])
-
-                    with self.backup_lock:
-                        # save to temp file
-                        temp_path_local = os.path.join(self.root_path, "..", "temp", "channel.backup")
-                        with open(temp_path_local, "wb") as file:
-                            file.write(multi_ch_bytes)
-
-                        # read back file and check the integrity of a backup snapshot
-                        with open(temp_path_local, "rb") as file:
-                            multi_ch_bytes_check = file.read()
-
-                        multi_chan_backup = {
-                            "chan_points": deepcopy(new_chan_points),
-                            "multi_chan_backup": multi_ch_bytes_check
-                        }
-                        for ch_point in multi_chan_backup["chan_points"]:
-                            ch_point["funding_txid_bytes"] = b64decode(ch_point["funding_txid_bytes"])[:: -1]
-
-                        json_out_verify, error = self.verify_chan_backup(multi_chan_backup=multi_chan_backup)
-                        msg_verify = "Multi Channel Backup, backup file integrity check failed. "
-                        if error is not None:
-                            logToFile(msg_verify + str(error))
-                            continue
-                        if json_out_verify:  # if json_out_verify is not empty dict than verification failed
-                            logToFile(msg_verify + json.dumps(json_out_verify))
-                            continue
-
-                        # integrity check of backup is successful, we can save file to disk or send in chat
-                        try:
-                            if self.scb_on_disk:
-                                if self.scb_on_disk_path != "" and os.path.exists(self.scb_on_disk_path):
-                                    copy(temp_path_local, self.scb_on_disk_path)
-                                else:
-                                    copy(temp_path_local, join(self.root_path, "..", "private"))
-                        except Exception as e:
-                            logToFile("Multi Channel Backup, " + str(e))
-
-                        for username in self.userdata.get_usernames():
-                            chat_id = self.userdata.get_chat_id(username)
-                            backups_state = self.userdata.get_backups_state(username)
-                            if chat_id is not None and backups_state["chatscb"] is True:
-                                # delete last backup message
-                                if backups_state["last_scb_backup_msg_id"] is not None:
-                                    try:
-                                        self.bot.delete_message(chat_id=chat_id, message_id=backups_state["last_scb_backup_msg_id"])
-                                    except Exception as e:
-                                        logToFile("Multi Channel Backup, last backup message cannot be deleted. (probably more than 48h from last message) user="+str(username))
-                                # send new backup file
-                                caption_text = "<b>Multi Channel Backup</b>"
-                                new_message = self.bot.send_document(chat_id=chat_id, document=open(temp_path_local, "rb"), parse_mode=telegram.ParseMode.HTML,
-                                                                        caption=caption_text, filename="channel.backup", disable_notification=True)
-                                # save new backup message data
-                                if new_message and hasattr(new_message, "message_id"):
-                                    self.userdata.set_last_scb_backup_msg_id(username, new_message.message_id)
-                                    self.userdata.set_last_scb_backup_file_id(username, new_message.document.file_id)
-                                    self.userdata.set_last_scb_backup_chan_points(username, new_chan_points)
-
-                        if os.path.exists(temp_path_local):
-                            os.remove(temp_path_local)
-
-            except Exception as e:
-                msg = "LiveFeed LocalNode subscribe channel backups: connection lost, will retry after " + str(self.sub_sleep_retry) + " seconds"
-                logToFile(msg)
-                sleep(self.sub_sleep_retry)
+            request = ln.ListInvoiceRequest(index_offset=index_offset, num_max_invoices=self.invoice_page_size)
+            response = self.invoker.call("ListInvoices", request)
+            for invoice in response.invoices:
+                self.handle_invoice(invoice)
+            if len(response.invoices) < self.invoice_page_size or response.last_index_offset <= index_offset:
+                break
+            index_offset = response.last_index_offset
+
+    def start_transactions_stream(self):
+        # announce transitions missed while stream was down, lnd returns whole wallet history so only
+        # transactions from last checked height (minus reorg margin) and unconfirmed ones are processed
+        if self.tx_log.block_height == 0:
+            lninfo, error = self.get_ln_info()
+            if error is None:
+                self.tx_log.set_block_height(lninfo["block_height"])  # first start, older transactions are not announced
+            return
+
+        from_height = self.tx_log.block_height - self.tx_reorg_margin
+        response = self.invoker.call("GetTransactions", ln.GetTransactionsRequest())
+        for tx in response.transactions:
+            if tx.num_confirmations == 0 or tx.block_height >= from_height:
+                self.handle_transaction(tx)
+
+    def start_channel_events_stream(self):
+        self.invalidate_channel_snapshot()  # events could be missed while stream was down
+
+    def start_subscriptions(self):
+        self.supervisor.add("invoices", "SubscribeInvoices", self.invoice_subscription, self.handle_invoice,
+                            on_start=self.start_invoices_stream)
+        self.supervisor.add("transactions", "SubscribeTransactions", ln.GetTransactionsRequest, self.handle_transaction,
+                            on_start=self.start_transactions_stream)
+        self.supervisor.add("channel events", "SubscribeChannelEvents", ln.ChannelEventSubscription, self.handle_channel_event,
+                            on_start=self.start_channel_events_stream, supported=self.supports_backup_streams)
+        # check if channel backups exists if not or not updated, save or send new backup file
+        self.supervisor.add("channel backups", "SubscribeChannelBackups", ln.ChannelBackupSubscription, self.handle_channel_backup,
+                            on_start=self.update_channel_backups, supported=self.supports_backup_streams)
+        # fill alias cache in bulk, also catches up on updates missed while disconnected
+        self.supervisor.add("channel graph", "SubscribeChannelGraph", ln.GraphTopologySubscription, self.handle_graph_update,
+                            on_start=self.warm_alias_cache)
+        self.supervisor.start()
+
+    def get_stream_states(self):
+        return self.supervisor.get_states()
+
+    def get_dispatch_stats(self):
+        return self.dispatcher.get_stats()
+
+    def get_event_stats(self):
+        return self.events.get_stats()
+
+    def stop(self):
+        self.supervisor.stop()
+        self.events.stop()
+        self.invoice_digest.stop()
+        self.dispatcher.stop()
+        self.rpc_pool.shutdown(wait=False)
+        if self.channel is not None:
+            self.channel.close()
+
+    def handle_invoice(self, response):
+        invoice = Invoice.from_proto(response)
+        # received payment, replayed or already announced settlements are skipped, index is saved only after
+        # notification is in outbox, so crash in between means notification is sent again rather than lost
+        if self.invoice_index.is_new(invoice.settled, invoice.settle_index):
+            self.invalidate_channel_snapshot()  # channel balances changed
+            self.events.publish(InvoiceSettled(invoice), wait=True)
+        self.invoice_index.process(invoice.add_index, invoice.settled, invoice.settle_index)
+
+    def handle_channel_event(self, response):
+        self.patch_channel_snapshot(response)
+        if response.type == ln.ChannelEventUpdate.OPEN_CHANNEL:
+            self.events.publish(ChannelOpened(Channel.from_proto(response.open_channel)))
+        elif response.type == ln.ChannelEventUpdate.CLOSED_CHANNEL:
+            ch = response.closed_channel
+            self.events.publish(ChannelClosed(ch.remote_pubkey, ch.channel_point, ch.capacity, ch.settled_balance, ch.closing_tx_hash,
+                                              ln.ChannelCloseSummary.ClosureType.Name(ch.close_type).lower()))
+
+    def transaction_stage(self, tx):
+        if tx.amount > 0:
+            return "received_confirmed" if tx.num_confirmations >= 1 else "received_unconfirmed"
+        if tx.amount < 0 and tx.num_confirmations >= 1:
+            return "sent_confirmed"
+        return None
+
+    def handle_transaction(self, response):
+        tx = Transaction.from_proto(response)
+        stage = self.transaction_stage(tx)
+        if stage is None or self.tx_log.contains(tx.tx_hash, stage):
+            return  # not announced or duplicate
+        self.events.publish(TxConfirmed(tx, stage), wait=True)  # logged as notified once it is in outbox
+        self.tx_log.add(tx.tx_hash, stage)
+        self.tx_log.set_block_height(tx.block_height)  # catch-up after reconnect starts from here
+
+    # notifications, telegram consumer of event bus
+
+    def notify_event(self, event):
+        if isinstance(event, InvoiceSettled):
+            self.notify_invoice(event)
+        elif isinstance(event, TxConfirmed):
+            self.notify_transaction(event)
+        elif isinstance(event, ChannelOpened):
+            self.notify_channel_opened(event)
+        elif isinstance(event, ChannelClosed):
+            self.notify_channel_closed(event)
+        elif isinstance(event, BackupUpdated):
+            self.notify_backup(event)
+        elif isinstance(event, NodeStatus) and event.message != "":
+            chat_ids = [recipient.chat_id for recipient in self.userdata.get_notification_recipients("node")]
+            self.send_notification("node_status", [(chat_ids, event.message)], event.received)
+
+    def send_rendered(self, template, values, recipients, received, event_key=None, **kwargs):
+        # each distinct preference group is rendered once and sent to all its chats
+        rendered = self.renderer.render_for(template, values, recipients, event_key)
+        self.send_notification(template.name, rendered, received, **kwargs)
+
+    def send_notification(self, event_type, rendered, received, **kwargs):
+        # rendered is list of (chat_ids, text), latency is measured from received (monotonic time of event receipt)
+        self.latency.record(event_type, "render", received)
+        self.latency.record_depth(self.dispatcher.depth())
+
+        def on_sent(result, error):
+            if error is None:
+                self.latency.record(event_type, "send", received)
+
+        for chat_ids, text in rendered:
+            for chat_id in chat_ids:
+                self.dispatcher.send_message(chat_id, text=text, on_done=on_sent, parse_mode=telegram.ParseMode.HTML, **kwargs)
+
+    def get_latency_stats(self):
+        return self.latency.get_stats()
+
+    def notify_invoice(self, event):
+        invoice = event.invoice
+        recipients = []
+        for recipient in self.userdata.get_notification_recipients("invoices"):
+            if recipient.digest_window > 0:
+                self.invoice_digest.add((recipient.username, recipient.chat_id), invoice.amt_paid_sat, invoice.memo, recipient.digest_window)
+            else:
+                recipients.append(recipient)
+        values = {
+            "amount": invoice.amt_paid_sat,
+            "description": "Description: " + invoice.memo if invoice.memo != "" else ""
+        }
+        self.send_rendered(renderer.INVOICE_SETTLED, values, recipients, event.received, ("invoice", invoice.add_index))
+
+    def send_invoice_digest(self, key, digest):
+        received = monotonic()  # window end, payments themselves were received earlier by design
+        username, chat_id = key
+        recipient = Recipient(username, chat_id, self.userdata.get_selected_unit(username), "", "", 0)
+        values = {
+            "amount": digest.total,
+            "count": digest.count,
+            "total": digest.total,
+            "largest": digest.largest,
+            # memo belongs to one payment only, digest of several payments doesn't show it
+            "description": "Description: " + digest.memo if digest.count == 1 and digest.memo != "" else ""
+        }
+        template = renderer.INVOICE_SETTLED if digest.count == 1 else renderer.INVOICE_DIGEST
+        self.send_rendered(template, values, [recipient], received)
+
+    def notify_channel_opened(self, event):
+        channel_data = event.channel
+        fund_txid = channel_data.channel_point[:channel_data.channel_point.find(':')]
+        values = {
+            "initiator": "by us can now be used" if channel_data.initiator else "by remote peer",
+            "pubkey": channel_data.remote_pubkey,
+            "node_name": self.get_node_alias(channel_data.remote_pubkey) or channel_data.remote_pubkey,
+            "capacity": channel_data.capacity,
+            "local_balance": channel_data.local_balance,
+            "local_pct": channel_data.local_balance_pct,
+            "remote_balance": channel_data.remote_balance,
+            "remote_pct": channel_data.remote_balance_pct,
+            "csv_delay": channel_data.csv_delay,
+            "private": "yes" if channel_data.private else "no",
+            "txid": fund_txid,
+            "txid_short": fund_txid[:8] + "..." + fund_txid[-8:]
+        }
+        recipients = self.userdata.get_notification_recipients("chevents")
+        self.send_rendered(renderer.CHANNEL_OPENED, values, recipients, event.received, ("open", channel_data.channel_point),
+                           disable_web_page_preview=True)
+
+    def notify_channel_closed(self, event):
+        values = {
+            "pubkey": event.remote_pubkey,
+            "node_name": self.get_node_alias(event.remote_pubkey) or event.remote_pubkey,
+            "capacity": event.capacity,
+            "settled_balance": event.settled_balance,
+            "txid": event.closing_tx_hash,
+            "txid_short": event.closing_tx_hash[:8] + "..." + event.closing_tx_hash[-8:],
+            "close_type": event.close_type
+        }
+        recipients = self.userdata.get_notification_recipients("chevents")
+        self.send_rendered(renderer.CHANNEL_CLOSED, values, recipients, event.received, ("close", event.channel_point),
+                           disable_web_page_preview=True)
+
+    def notify_transaction(self, event):
+        tx = event.tx
+        if event.stage == "received_unconfirmed":
+            title = "Unconfirmed incoming transaction"
+        elif event.stage == "received_confirmed":
+            title = "Received funds confirmed"
+        else:
+            title = "Sent transaction confirmed"
+
+        values = {
+            "title": title,
+            "amount": abs(tx.amount),
+            "fees": tx.total_fees,
+            "confirmations": "Confirmations: " + str(tx.num_confirmations) + "\n" if tx.num_confirmations > 0 else "",
+            "tx_hash": tx.tx_hash,
+            "tx_short": tx.tx_hash[:8] + "..." + tx.tx_hash[-8:]
+        }
+        template = renderer.TRANSACTION_FEES if tx.total_fees > 0 else renderer.TRANSACTION
+        recipients = self.userdata.get_notification_recipients("transactions")
+        self.send_rendered(template, values, recipients, event.received, (tx.tx_hash, event.stage), disable_web_page_preview=True)
+
+    def notify_backup(self, event):
+        recipients = []
+        for recipient in self.userdata.get_notification_recipients("chatscb"):
+            backups_state = self.userdata.get_backups_state(recipient.username)
+            if backups_state["last_scb_backup_msg_id"] is not None and backups_state["last_scb_backup_hash"] == event.fingerprint:
+                continue  # don't send new backup, channels are the same as last time
+            recipients.append((recipient.username, recipient.chat_id, backups_state["last_scb_backup_msg_id"]))
+        self.send_chat_backups(recipients, event.backup_bytes, event.fingerprint)
+
+    def handle_graph_update(self, response):
+        for node_update in response.node_updates:
+            self.alias_cache.set(node_update.identity_key, node_update.alias)
+
+    def handle_channel_backup(self, response):
+        # backup stream sends new backup only when channels changed
+        self.process_channel_backup(response.multi_chan_backup)
@@ -0,0 +1,187 @@
+import os
+import json
+import copy
+from collections import OrderedDict
+from threading import Lock
+from helper import logToFile
+
+
+class NodeState:
+
+    # small state of lnd subscriptions that has to survive bot restarts, written atomically on every change
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.data = {}
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as file:
+                    self.data = json.load(file)
+        except Exception as e:
+            logToFile("Exception NodeState load: " + str(e))
+
+    def get(self, key, default=None):
+        with self.lock:
+            return copy.deepcopy(self.data.get(key, default))
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = copy.deepcopy(value)
+            self.save()
+
+    def save(self):
+        # must be called with lock held
+        try:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(self.data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logToFile("Exception NodeState save: " + str(e))
+
+
+class InvoiceIndex:
+
+    # tracks add_index/settle_index of invoices so each settled invoice is announced once across reconnects and restarts
+    # settle indexes are contiguous in lnd, everything up to settle_index is handled, settled_above holds handled
+    # indexes after first gap (e.g. invoices replayed by stream out of order after catch-up), settle_index is seeded
+    # from lnd on first start, first settlement seen is not a watermark because settlements can arrive out of order
+
+    max_settled_above = 1000
+
+    def __init__(self, state):
+        self.state = state
+        self.lock = Lock()
+        data = state.get("invoices", {})
+        self.add_index = data.get("add_index", 0)
+        self.settle_index = data.get("settle_index", 0)
+        self.settled_above = set(data.get("settled_above", []))
+
+    def is_empty(self):
+        return self.add_index == 0 and self.settle_index == 0 and len(self.settled_above) == 0
+
+    def has_settle_index(self):
+        return self.settle_index > 0 or len(self.settled_above) > 0
+
+    def seed(self, add_index, settle_index):
+        # first start, older invoices and settlements are not announced
+        with self.lock:
+            self.add_index = max(self.add_index, add_index)
+            if not self.has_settle_index():
+                self.settle_index = settle_index
+            self.save()
+
+    def is_new(self, settled, settle_index):
+        # True if settlement was not handled yet, index is not changed
+        with self.lock:
+            if not settled:
+                return False
+            return settle_index == 0 or (settle_index > self.settle_index and settle_index not in self.settled_above)
+
+    def process(self, add_index, settled, settle_index):
+        # returns True if invoice settlement should be announced
+        with self.lock:
+            changed = add_index > self.add_index
+            self.add_index = max(self.add_index, add_index)
+            announce = False
+            if settled:
+                if settle_index == 0:
+                    announce = True  # lnd without settle index, can't dedupe
+                elif settle_index > self.settle_index and settle_index not in self.settled_above:
+                    self.settled_above.add(settle_index)
+                    self.advance()
+                    changed = announce = True
+            if changed:
+                self.save()
+            return announce
+
+    def advance(self):
+        # must be called with lock held
+        while self.settle_index + 1 in self.settled_above:
+            self.settle_index += 1
+            self.settled_above.remove(self.settle_index)
+        if len(self.settled_above) > self.max_settled_above:
+            # missing indexes are not coming anymore, continue from lowest handled index
+            self.settle_index = min(self.settled_above)
+            self.settled_above.remove(self.settle_index)
+            self.advance()
+
+    def save(self):
+        # must be called with lock held
+        self.state.set("invoices", {"add_index": self.add_index, "settle_index": self.settle_index,
+                                    "settled_above": sorted(self.settled_above)})
+
+
+class TxNotificationLog:
+
+    # remembers which (tx_hash, stage) notifications were sent, recent entries are kept in memory (bounded LRU),
+    # all entries are appended to log file which is compacted to recent entries when it grows too big
+
+    def __init__(self, path, state, max_size=10000):
+        self.path = path
+        self.state = state
+        self.max_size = max_size
+        self.lock = Lock()
+        self.entries = OrderedDict()  # (tx_hash, stage) -> None, least recently used first
+        self.log_lines = 0
+        self.block_height = state.get("transactions", {}).get("block_height", 0)  # height up to which transactions were checked
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as file:
+                    for line in file:
+                        parts = line.split()
+                        if len(parts) == 2:
+                            self.remember((parts[0], parts[1]))
+                            self.log_lines += 1
+        except Exception as e:
+            logToFile("Exception TxNotificationLog load: " + str(e))
+
+    def remember(self, key):
+        # must be called with lock held (or from constructor)
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def contains(self, tx_hash, stage):
+        with self.lock:
+            return (tx_hash, stage) in self.entries
+
+    def add(self, tx_hash, stage):
+        # returns False if notification was already sent
+        key = (tx_hash, stage)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return False
+            self.remember(key)
+            try:
+                with open(self.path, "a") as file:
+                    file.write(tx_hash + " " + stage + "\n")
+                self.log_lines += 1
+                if self.log_lines > 2 * self.max_size:
+                    self.compact()
+            except Exception as e:
+                logToFile("Exception TxNotificationLog add: " + str(e))
+            return True
+
+    def compact(self):
+        # must be called with lock held, rewrite log with entries kept in memory
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            for tx_hash, stage in self.entries:
+                file.write(tx_hash + " " + stage + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.log_lines = len(self.entries)
+
+    def set_block_height(self, block_height):
+        with self.lock:
+            if block_height <= self.block_height:
+                return
+            self.block_height = block_height
+        self.state.set("transactions", {"block_height": block_height})
@@ -0,0 +1,84 @@
+import os
+import json
+from collections import OrderedDict
+from threading import Lock
+from helper import logToFile
+
+
+class NotificationOutbox:
+
+    # append-only log of notifications, entry is written before delivery and marked done after it, so notifications
+    # not delivered before crash or restart are sent on next start, log is compacted to pending entries when it grows
+
+    def __init__(self, path, compact_after=1000):
+        self.path = path
+        self.compact_after = compact_after
+        self.lock = Lock()
+        self.pending = OrderedDict()  # id -> entry, oldest first
+        self.next_id = 1
+        self.log_lines = 0
+        try:
+            if os.path.exists(path):
+                with open(path, "r") as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # partially written last line
+                        if record["op"] == "add":
+                            self.pending[record["id"]] = record
+                        elif record["op"] == "done":
+                            self.pending.pop(record["id"], None)
+                        self.next_id = max(self.next_id, record["id"] + 1)
+                        self.log_lines += 1
+        except Exception as e:
+            logToFile("Exception NotificationOutbox load: " + str(e))
+
+    def add(self, method, chat_id, kwargs):
+        # returns id of new entry, None if it could not be written
+        with self.lock:
+            record = {"op": "add", "id": self.next_id, "method": method, "chat_id": chat_id, "kwargs": kwargs}
+            try:
+                self.write(record, sync=True)
+            except Exception as e:
+                logToFile("Exception NotificationOutbox add: " + str(e))
+                return None
+            self.next_id += 1
+            self.pending[record["id"]] = record
+            return record["id"]
+
+    def done(self, entry_id):
+        # lost done record only means notification is sent once more, so it is not synced to disk
+        with self.lock:
+            if self.pending.pop(entry_id, None) is None:
+                return
+            try:
+                self.write({"op": "done", "id": entry_id}, sync=False)
+                if self.log_lines > len(self.pending) + self.compact_after:
+                    self.compact()
+            except Exception as e:
+                logToFile("Exception NotificationOutbox done: " + str(e))
+
+    def write(self, record, sync):
+        # must be called with lock held
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        self.log_lines += 1
+
+    def compact(self):
+        # must be called with lock held, rewrite log with pending entries only
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            for record in self.pending.values():
+                file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.log_lines = len(self.pending)
+
+    def get_pending(self):
+        with self.lock:
+            return [(record["id"], record["method"], record["chat_id"], record["kwargs"]) for record in self.pending.values()]
@@ -0,0 +1,203 @@
+import rpc_pb2 as ln
+from helper import logToFile
+from collections import deque, OrderedDict
+from threading import Lock, Thread, Timer, current_thread
+from queue import Queue
+
+
+class PaymentEngine:
+
+    # multiplexes payments over one bidirectional SendPayment stream, responses are matched by payment hash,
+    # lnd rejects invalid requests without hash (or with all-zero hash), so requests are checked before they are
+    # sent, rejection that still can't be matched is only resolved once every other payment in flight got its result
+
+    payment_timeout = 10*60  # slot is freed and payment reported as unknown if lnd never answers
+
+    def __init__(self, invoker, max_in_flight=5, on_payment_done=None, check_request=None):
+        self.invoker = invoker
+        self.max_in_flight = max(1, max_in_flight)
+        self.on_payment_done = on_payment_done
+        self.check_request = check_request  # check_request(pay_req) returns reason lnd would reject it, None if valid
+        self.lock = Lock()
+        self.in_flight = OrderedDict()  # payment_hash hex -> (on_progress, on_done, timer), in send order
+        self.waiting = deque()  # payments waiting for free slot
+        self.rejections = []  # errors of rejections not matched yet, no new payment is sent until they are resolved
+        self.requests = None  # request queue of currently open stream
+        self.stream_id = 0
+
+    def pay(self, pay_req, payment_hash, on_progress, on_done):
+        error = self.check(pay_req)
+        if error is not None:
+            self.finish(on_done, None, error)
+            return
+
+        with self.lock:
+            duplicate = payment_hash in self.in_flight or any(p[1] == payment_hash for p in self.waiting)
+            if duplicate:
+                position = 0
+            elif len(self.in_flight) >= self.max_in_flight or len(self.rejections) > 0:
+                self.waiting.append((pay_req, payment_hash, on_progress, on_done))
+                position = len(self.waiting)
+            else:
+                position = 0
+                self.start_payment(pay_req, payment_hash, on_progress, on_done)
+
+        if duplicate:
+            self.finish(on_done, None, "payment for this invoice is already in progress")
+        elif position > 0:
+            self.notify(on_progress, "queued", position)
+
+    def check(self, pay_req):
+        if self.check_request is None:
+            return None
+        try:
+            return self.check_request(pay_req)
+        except Exception as e:
+            logToFile("Exception PaymentEngine check: " + str(e))
+            return "invoice can't be checked, " + str(e)
+
+    def start_payment(self, pay_req, payment_hash, on_progress, on_done):
+        # must be called with lock held
+        if self.requests is None:
+            self.open_stream()
+        timer = Timer(self.payment_timeout, self.payment_timed_out, args=[payment_hash])
+        timer.daemon = True
+        self.in_flight[payment_hash] = (on_progress, on_done, timer)
+        self.requests.put(ln.SendRequest(payment_request=pay_req))
+        timer.start()
+        Thread(target=self.notify, args=[on_progress, "sending", 0], daemon=True).start()
+
+    def open_stream(self):
+        # must be called with lock held
+        self.stream_id += 1
+        self.requests = Queue()
+        Thread(target=self.read_stream, args=[self.stream_id, self.requests], daemon=True).start()
+
+    def request_iterator(self, requests):
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            yield request
+
+    def read_stream(self, stream_id, requests):
+        error = "payment stream closed"
+        try:
+            call = self.invoker.stream("SendPayment", self.request_iterator(requests))
+            for response in self.invoker.iterate("SendPayment", call):
+                self.handle_response(response)
+        except Exception as e:
+            error = str(e)
+            logToFile("Exception PaymentEngine read_stream: " + error)
+        finally:
+            self.stream_lost(stream_id, requests, error)
+
+    def handle_response(self, response):
+        payment_hash = response.payment_hash.hex()
+        finished = []
+        unknown = []
+        with self.lock:
+            if payment_hash.strip("0") == "":
+                self.rejections.append(response.payment_error)
+                if len(self.rejections) < len(self.in_flight):
+                    unknown = [callbacks[0] for callbacks in self.in_flight.values()]  # can't tell which one was rejected
+            else:
+                callbacks = self.in_flight.pop(payment_hash, None)
+                if callbacks is None:
+                    logToFile("PaymentEngine, response for unknown payment " + payment_hash)
+                else:
+                    finished.append((payment_hash, callbacks, response.payment_error, response.payment_route))
+            finished += self.resolve_rejections()
+            failed = self.start_waiting()
+
+        for on_progress in unknown:
+            self.notify(on_progress, "unknown", 0)
+        self.finish_payments(finished, failed)
+
+    def resolve_rejections(self):
+        # must be called with lock held, when there are as many unmatched rejections as payments in flight,
+        # all of them were rejected
+        if len(self.rejections) == 0 or len(self.rejections) < len(self.in_flight):
+            return []
+        errors = sorted(set(self.rejections))
+        error = errors[0] if len(errors) == 1 else "payment rejected by node (" + "; ".join(errors) + ")"
+        rejected = [(payment_hash, callbacks, error, None) for payment_hash, callbacks in self.in_flight.items()]
+        self.in_flight = OrderedDict()
+        self.rejections = []
+        return rejected
+
+    def finish_payments(self, finished, failed):
+        for payment_hash, callbacks, payment_error, route in finished:
+            callbacks[2].cancel()
+            result = {
+                "payment_hash": payment_hash,
+                "payment_error": payment_error,
+                "total_amt": route.total_amt if route is not None else 0,
+                "total_fees_msat": route.total_fees_msat if route is not None else 0,
+                "num_hops": len(route.hops) if route is not None else 0
+            }
+            if payment_error == "" and self.on_payment_done is not None:
+                self.on_payment_done()
+            self.finish(callbacks[1], result, None)
+        for on_done, error in failed:
+            self.finish(on_done, None, error)
+
+    def start_waiting(self):
+        # must be called with lock held, returns (on_done, error) of waiting payments that can't be sent anymore
+        failed = []
+        while self.waiting and len(self.in_flight) < self.max_in_flight and len(self.rejections) == 0:
+            pay_req, payment_hash, on_progress, on_done = self.waiting.popleft()
+            error = self.check(pay_req)  # invoice could expire while waiting
+            if error is not None:
+                failed.append((on_done, error))
+                continue
+            self.start_payment(pay_req, payment_hash, on_progress, on_done)
+        return failed
+
+    def stream_lost(self, stream_id, requests, error):
+        with self.lock:
+            if stream_id != self.stream_id:
+                return
+            requests.put(None)  # end request iterator
+            self.requests = None
+            lost = list(self.in_flight.values())
+            self.in_flight = OrderedDict()
+            self.rejections = []
+            failed = self.start_waiting()  # opens new stream for waiting payments
+
+        for on_progress, on_done, timer in lost:
+            # payment could still complete on node side
+            timer.cancel()
+            self.finish(on_done, None, "connection to node lost, payment status unknown (" + error + ")")
+        self.finish_payments([], failed)
+
+    def payment_timed_out(self, payment_hash):
+        with self.lock:
+            callbacks = self.in_flight.get(payment_hash)
+            if callbacks is None or callbacks[2] is not current_thread():
+                return  # answered meanwhile, or hash was paid again
+            del self.in_flight[payment_hash]
+            if len(self.rejections) > 0:
+                # payment without answer is counted as rejected one, so rejection is never given to payment that can
+                # still get its own result, at worst that payment times out as unknown too
+                self.rejections.pop(0)
+            finished = self.resolve_rejections()
+            failed = self.start_waiting()
+        logToFile("PaymentEngine, no response for payment " + payment_hash)
+        self.finish(callbacks[1], None, "no response from node, payment status unknown")
+        self.finish_payments(finished, failed)
+
+    def notify(self, on_progress, state, position):
+        try:
+            on_progress(state, position)
+        except Exception as e:
+            logToFile("Exception PaymentEngine notify: " + str(e))
+
+    def finish(self, on_done, result, error):
+        try:
+            on_done(result, error)
+        except Exception as e:
+            logToFile("Exception PaymentEngine finish: " + str(e))
+
+    def num_in_flight(self):
+        return len(self.in_flight), len(self.waiting)
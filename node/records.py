@@ -0,0 +1,116 @@
+import rpc_pb2 as ln
+
+
+# compact records built directly from protobuf messages, numeric fields stay numbers
+
+
+class Channel:
+
+    __slots__ = ("active", "remote_pubkey", "channel_point", "chan_id", "capacity", "local_balance", "remote_balance",
+                 "commit_fee", "unsettled_balance", "total_satoshis_sent", "total_satoshis_received", "num_updates",
+                 "csv_delay", "private", "initiator", "alias")
+
+    def __init__(self, active, remote_pubkey, channel_point, chan_id, capacity, local_balance, remote_balance, commit_fee,
+                 unsettled_balance, total_satoshis_sent, total_satoshis_received, num_updates, csv_delay, private, initiator):
+        self.active = active
+        self.remote_pubkey = remote_pubkey
+        self.channel_point = channel_point
+        self.chan_id = chan_id
+        self.capacity = capacity
+        self.local_balance = local_balance
+        self.remote_balance = remote_balance
+        self.commit_fee = commit_fee
+        self.unsettled_balance = unsettled_balance
+        self.total_satoshis_sent = total_satoshis_sent
+        self.total_satoshis_received = total_satoshis_received
+        self.num_updates = num_updates
+        self.csv_delay = csv_delay
+        self.private = private
+        self.initiator = initiator
+        self.alias = ""  # filled by wallet from node alias cache
+
+    @classmethod
+    def from_proto(cls, ch):
+        return cls(ch.active, ch.remote_pubkey, ch.channel_point, ch.chan_id, ch.capacity, ch.local_balance, ch.remote_balance,
+                   ch.commit_fee, ch.unsettled_balance, ch.total_satoshis_sent, ch.total_satoshis_received, ch.num_updates,
+                   ch.csv_delay, ch.private, ch.initiator)
+
+    def copy(self):
+        ch = Channel(self.active, self.remote_pubkey, self.channel_point, self.chan_id, self.capacity, self.local_balance,
+                     self.remote_balance, self.commit_fee, self.unsettled_balance, self.total_satoshis_sent,
+                     self.total_satoshis_received, self.num_updates, self.csv_delay, self.private, self.initiator)
+        ch.alias = self.alias
+        return ch
+
+    @property
+    def local_balance_pct(self):
+        total = self.local_balance + self.remote_balance
+        return int(round((self.local_balance / total) * 100)) if total > 0 else 0
+
+    @property
+    def remote_balance_pct(self):
+        total = self.local_balance + self.remote_balance
+        return int(round((self.remote_balance / total) * 100)) if total > 0 else 0
+
+
+class Invoice:
+
+    __slots__ = ("memo", "value", "settled", "amt_paid_sat", "creation_date", "settle_date", "add_index", "settle_index", "state")
+
+    def __init__(self, memo, value, settled, amt_paid_sat, creation_date, settle_date, add_index, settle_index, state):
+        self.memo = memo
+        self.value = value
+        self.settled = settled
+        self.amt_paid_sat = amt_paid_sat
+        self.creation_date = creation_date
+        self.settle_date = settle_date
+        self.add_index = add_index
+        self.settle_index = settle_index
+        self.state = state
+
+    @classmethod
+    def from_proto(cls, invoice):
+        return cls(invoice.memo, invoice.value, invoice.settled or invoice.state == ln.Invoice.SETTLED, invoice.amt_paid_sat,
+                   invoice.creation_date, invoice.settle_date, invoice.add_index, invoice.settle_index, invoice.state)
+
+
+class Transaction:
+
+    __slots__ = ("tx_hash", "amount", "num_confirmations", "block_height", "time_stamp", "total_fees")
+
+    def __init__(self, tx_hash, amount, num_confirmations, block_height, time_stamp, total_fees):
+        self.tx_hash = tx_hash
+        self.amount = amount
+        self.num_confirmations = num_confirmations
+        self.block_height = block_height
+        self.time_stamp = time_stamp
+        self.total_fees = total_fees
+
+    @classmethod
+    def from_proto(cls, tx):
+        return cls(tx.tx_hash, tx.amount, tx.num_confirmations, tx.block_height, tx.time_stamp, tx.total_fees)
+
+
+class NodeInfo:
+
+    __slots__ = ("pub_key", "alias", "color", "num_channels", "total_capacity")
+
+    def __init__(self, pub_key, alias, color, num_channels, total_capacity):
+        self.pub_key = pub_key
+        self.alias = alias
+        self.color = color
+        self.num_channels = num_channels
+        self.total_capacity = total_capacity
+
+    @classmethod
+    def from_proto(cls, info):
+        return cls(info.node.pub_key, info.node.alias, info.node.color, info.num_channels, info.total_capacity)
+
+
+def channel_point_str(ch_point):
+    # ChannelPoint message to "txid:index" string, txid bytes are in reversed order
+    if ch_point.funding_txid_str != "":
+        txid = ch_point.funding_txid_str
+    else:
+        txid = ch_point.funding_txid_bytes[:: -1].hex()
+    return txid + ":" + str(ch_point.output_index)
@@ -0,0 +1,117 @@
+from string import Formatter
+from helper import formatAmount
+from node.cache import TTLCache
+
+
+class NotificationTemplate:
+
+    # template is parsed once, fields named in amount_fields are formatted in recipient's unit,
+    # {explorer} and {search} are replaced with recipient's block explorer and node search links
+
+    def __init__(self, name, template, amount_fields=()):
+        self.name = name
+        self.parts = list(Formatter().parse(template))
+        self.amount_fields = set(amount_fields)
+        fields = set(part[1] for part in self.parts if part[1] is not None)
+        # only preferences used by template split recipients into groups
+        self.uses_unit = len(self.amount_fields) > 0
+        self.uses_explorer = "explorer" in fields
+        self.uses_search = "search" in fields
+
+    def pref_key(self, recipient):
+        return (recipient.unit if self.uses_unit else None,
+                recipient.explorer if self.uses_explorer else None,
+                recipient.search_link if self.uses_search else None)
+
+
+class NotificationRenderer:
+
+    def __init__(self):
+        self.amount_cache = TTLCache(max_size=10000, ttl=24*60*60)
+        self.text_cache = TTLCache(max_size=2000, ttl=10*60)
+
+    def format_amount(self, amount, unit):
+        key = (amount, unit)
+        text = self.amount_cache.get(key)
+        if text is None:
+            text = formatAmount(amount, unit)
+            self.amount_cache.set(key, text)
+        return text
+
+    def render(self, template, values, unit="sats", explorer="", search_link=""):
+        out = []
+        for literal, field, format_spec, conversion in template.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            if field == "explorer":
+                out.append(explorer)
+            elif field == "search":
+                out.append(search_link)
+            elif field in template.amount_fields:
+                out.append(self.format_amount(values[field], unit))
+            else:
+                out.append(str(values[field]))
+        return "".join(out)
+
+    def render_for(self, template, values, recipients, event_key=None):
+        # returns list of (chat_ids, text), each distinct preference group is rendered once
+        # with event_key rendered texts are cached, so same event rendered again (e.g. resend) is not formatted twice
+        groups = {}
+        for recipient in recipients:
+            groups.setdefault(template.pref_key(recipient), []).append(recipient)
+
+        result = []
+        for key, members in groups.items():
+            cache_key = (template.name, event_key, key) if event_key is not None else None
+            text = self.text_cache.get(cache_key) if cache_key is not None else None
+            if text is None:
+                first = members[0]
+                text = self.render(template, values, first.unit, first.explorer, first.search_link)
+                if cache_key is not None:
+                    self.text_cache.set(cache_key, text)
+            result.append(([member.chat_id for member in members], text))
+        return result
+
+
+INVOICE_SETTLED = NotificationTemplate(
+    "invoice_settled",
+    "<b>Received LN payment.</b>\nAmount: {amount}\n{description}",
+    amount_fields=["amount"])
+
+INVOICE_DIGEST = NotificationTemplate(
+    "invoice_digest",
+    "<b>{count} LN payments received.</b>\nTotal: {total}\nLargest: {largest}\n",
+    amount_fields=["total", "largest"])
+
+TRANSACTION = NotificationTemplate(
+    "transaction",
+    "<b>{title}</b>\nAmount: {amount}\n{confirmations}Txid: <a href='{explorer}{tx_hash}'>{tx_short}</a>\n",
+    amount_fields=["amount"])
+
+TRANSACTION_FEES = NotificationTemplate(
+    "transaction_fees",
+    "<b>{title}</b>\nAmount: {amount}\nFees: {fees}\n{confirmations}Txid: <a href='{explorer}{tx_hash}'>{tx_short}</a>\n",
+    amount_fields=["amount", "fees"])
+
+CHANNEL_OPENED = NotificationTemplate(
+    "channel_opened",
+    "<b>New channel opened {initiator}</b>\n"
+    "<a href='{search}{pubkey}'>{node_name}</a>\n"
+    "Capacity: {capacity}\n"
+    "Local Balance: {local_balance} ({local_pct}%)\n"
+    "Remote Balance: {remote_balance} ({remote_pct}%)\n"
+    "Time Lock: {csv_delay}\n"
+    "Private: {private}\n"
+    "Txid: <a href='{explorer}{txid}'>{txid_short}</a>\n",
+    amount_fields=["capacity", "local_balance", "remote_balance"])
+
+CHANNEL_CLOSED = NotificationTemplate(
+    "channel_closed",
+    "<b>Channel closed</b>\n"
+    "<a href='{search}{pubkey}'>{node_name}</a>\n"
+    "Capacity: {capacity}\n"
+    "Settled Balance: {settled_balance}\n"
+    "Txid: <a href='{explorer}{txid}'>{txid_short}</a>\n"
+    "Closure Type: {close_type}",
+    amount_fields=["capacity", "settled_balance"])
@@ -0,0 +1,170 @@
+import grpc
+from threading import Lock
+from time import monotonic, sleep
+
+
+class RpcError(Exception):
+
+    def __init__(self, method, code, details):
+        super().__init__(details)
+        self.method = method
+        self.code = code  # grpc.StatusCode or None if call failed before reaching lnd
+        self.details = details
+
+    def __str__(self):
+        return str(self.details)
+
+
+class RpcStats:
+
+    buckets_ms = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    def __init__(self):
+        self.lock = Lock()
+        self.methods = {}
+
+    def get_method(self, method):
+        if method not in self.methods:
+            self.methods[method] = {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                    "histogram": [0] * (len(self.buckets_ms) + 1)}
+        return self.methods[method]
+
+    def record(self, method, latency_ms, error=False):
+        with self.lock:
+            stats = self.get_method(method)
+            stats["calls"] += 1
+            stats["total_ms"] += latency_ms
+            stats["max_ms"] = max(stats["max_ms"], latency_ms)
+            if error:
+                stats["errors"] += 1
+            idx = 0
+            while idx < len(self.buckets_ms) and latency_ms > self.buckets_ms[idx]:
+                idx += 1
+            stats["histogram"][idx] += 1
+
+    def record_error(self, method):
+        with self.lock:
+            self.get_method(method)["errors"] += 1
+
+    def record_retry(self, method):
+        with self.lock:
+            self.get_method(method)["retries"] += 1
+
+    def percentile(self, histogram, pct):
+        # upper bound of bucket containing given percentile
+        total = sum(histogram)
+        if total == 0:
+            return 0
+        count = 0
+        for idx, value in enumerate(histogram):
+            count += value
+            if count >= total * pct / 100.0:
+                return self.buckets_ms[idx] if idx < len(self.buckets_ms) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for method, stats in self.methods.items():
+                result[method] = dict(stats)
+                result[method]["histogram"] = list(stats["histogram"])
+            return result
+
+
+class RpcInvoker:
+
+    default_deadline = 30
+    # seconds, None means no deadline (long running streams)
+    deadlines = {
+        "GetInfo": 10,
+        "DecodePayReq": 10,
+        "GetNodeInfo": 10,
+        "DescribeGraph": 120,
+        "SendPayment": None,
+        "OpenChannelSync": 120,
+        "CloseChannel": 120,
+        "SubscribeInvoices": None,
+        "SubscribeTransactions": None,
+        "SubscribeChannelEvents": None,
+        "SubscribeChannelBackups": None,
+        "SubscribeChannelGraph": None
+    }
+    # read-only calls that are safe to repeat
+    idempotent = {
+        "GetInfo", "GetNodeInfo", "DecodePayReq", "DescribeGraph", "ListChannels", "WalletBalance", "ChannelBalance",
+        "PendingChannels", "ExportAllChannelBackups", "VerifyChanBackup", "ListInvoices", "GetTransactions"
+    }
+    retry_codes = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED}
+
+    def __init__(self, get_stub, max_retries=2, backoff=0.5):
+        self.get_stub = get_stub
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = RpcStats()
+
+    def get_deadline(self, method):
+        return self.deadlines.get(method, self.default_deadline)
+
+    def call(self, method, request, timeout=-1, retries=None):
+        if timeout == -1:
+            timeout = self.get_deadline(method)
+        if retries is None:
+            retries = self.max_retries if method in self.idempotent else 0
+
+        attempt = 0
+        while True:
+            start = monotonic()
+            try:
+                response = getattr(self.get_stub(), method)(request, timeout=timeout)
+                self.stats.record(method, (monotonic() - start) * 1000)
+                return response
+            except Exception as e:
+                self.stats.record(method, (monotonic() - start) * 1000, error=True)
+                error = self.map_error(method, e)
+                if attempt >= retries or error.code not in self.retry_codes:
+                    raise error
+                attempt += 1
+                self.stats.record_retry(method)
+                sleep(self.backoff * (2 ** (attempt - 1)))
+
+    def stream(self, method, request, timeout=-1):
+        # response streams are not retried here, subscription loops reconnect on their own
+        if timeout == -1:
+            timeout = self.get_deadline(method)
+        start = monotonic()
+        try:
+            call = getattr(self.get_stub(), method)(request, timeout=timeout)
+            self.stats.record(method, (monotonic() - start) * 1000)
+            return call
+        except Exception as e:
+            self.stats.record(method, (monotonic() - start) * 1000, error=True)
+            raise self.map_error(method, e)
+
+    def iterate(self, method, call):
+        # iterate response stream, errors raised while reading are mapped as well
+        try:
+            for response in call:
+                yield response
+        except Exception as e:
+            self.stats.record_error(method)
+            raise self.map_error(method, e)
+
+    def map_error(self, method, e):
+        if isinstance(e, RpcError):
+            return e
+        if isinstance(e, grpc.RpcError) and hasattr(e, "code") and hasattr(e, "details"):
+            return RpcError(method, e.code(), e.details())
+        return RpcError(method, None, str(e))
+
+    def format_bucket(self, value):
+        return "<=" + str(value) if value != float("inf") else ">" + str(self.stats.buckets_ms[-1])
+
+    def format_stats(self):
+        lines = []
+        for method, stats in sorted(self.stats.snapshot().items()):
+            avg = stats["total_ms"] / stats["calls"] if stats["calls"] > 0 else 0
+            p50 = self.stats.percentile(stats["histogram"], 50)
+            p95 = self.stats.percentile(stats["histogram"], 95)
+            lines.append(method + ": calls " + str(stats["calls"]) + ", errors " + str(stats["errors"]) + ", retries " + str(stats["retries"])
+                         + ", avg " + str(int(avg)) + "ms, p50 " + self.format_bucket(p50) + "ms, p95 " + self.format_bucket(p95) + "ms, max " + str(int(stats["max_ms"])) + "ms")
+        return lines
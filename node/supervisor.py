@@ -0,0 +1,184 @@
+from helper import logToFile
+from threading import Thread
+from time import monotonic
+import random
+
+
+class StreamSpec:
+
+    def __init__(self, name, method, request, handle, on_start=None, supported=None):
+        self.name = name
+        self.method = method
+        self.request = request  # callable returning request message, called on every (re)connect
+        self.handle = handle
+        self.on_start = on_start
+        self.supported = supported
+
+        # runtime state, guarded by supervisor condition
+        self.state = "idle"
+        self.call = None
+        self.thread = None
+        self.failures = 0
+        self.restarts = 0
+        self.messages = 0
+        self.last_error = ""
+        self.state_since = monotonic()
+        self.next_start = 0
+
+
+class SubscriptionSupervisor:
+
+    # one control loop owns all lnd subscription streams: starts them when node is online, restarts failed streams with
+    # jittered exponential backoff, runs node watcher checks and cancels everything on stop
+    # gRPC bindings are synchronous so every open stream is read by its own thread, loop only schedules them
+
+    stable_after = 60  # stream running this long resets its backoff
+
+    def __init__(self, node, base_delay=1, max_delay=300):
+        self.node = node
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cond = node.conn_cond  # woken by connectivity and online state changes as well
+        self.streams = []
+        self.wakeup = False
+        self.stopping = False
+        self.thread = None
+        self.next_watch = 0
+
+    def add(self, name, method, request, handle, on_start=None, supported=None):
+        self.streams.append(StreamSpec(name, method, request, handle, on_start, supported))
+
+    def start(self):
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        with self.cond:
+            self.stopping = True
+            calls = [spec.call for spec in self.streams if spec.call is not None]
+            self.cond.notify_all()
+        for call in calls:
+            call.cancel()  # unblocks reader threads
+
+        deadline = monotonic() + timeout
+        threads = [self.thread] + [spec.thread for spec in self.streams]
+        for thread in threads:
+            if thread is not None and thread.is_alive():
+                thread.join(max(0, deadline - monotonic()))
+        with self.cond:
+            for spec in self.streams:
+                if spec.thread is None:
+                    self.set_state(spec, "stopped")
+
+    def set_state(self, spec, state):
+        # must be called with condition held
+        if spec.state != state:
+            spec.state = state
+            spec.state_since = monotonic()
+
+    def backoff_delay(self, failures):
+        delay = min(self.max_delay, self.base_delay * (2 ** min(failures, 16)))
+        return random.uniform(delay / 2, delay)
+
+    def run(self):
+        generation = self.node.conn_generation
+        while True:
+            with self.cond:
+                if self.stopping:
+                    break
+                if self.node.conn_generation != generation:
+                    # connectivity changed, waiting streams are retried right away and node is checked
+                    generation = self.node.conn_generation
+                    self.next_watch = 0
+                    for spec in self.streams:
+                        if spec.thread is None:
+                            spec.next_start = 0
+
+            now = monotonic()
+            if now >= self.next_watch:
+                try:
+                    self.next_watch = monotonic() + self.node.watch_node()
+                except Exception as e:
+                    logToFile("Exception SubscriptionSupervisor node watcher: " + str(e))
+                    self.next_watch = monotonic() + self.node.node_watcher_sleep
+                generation = self.node.conn_generation  # changes made by node check itself are already handled
+
+            with self.cond:
+                if self.stopping:
+                    break
+                now = monotonic()
+                for spec in self.streams:
+                    if spec.thread is not None:
+                        continue  # running or connecting
+                    if not self.node.nodeOnline:
+                        self.set_state(spec, "waiting for node")
+                    elif spec.supported is not None and not spec.supported():
+                        self.set_state(spec, "unsupported")
+                    elif now >= spec.next_start:
+                        self.set_state(spec, "connecting")
+                        spec.thread = Thread(target=self.read_stream, args=[spec], daemon=True)
+                        spec.thread.start()
+
+                next_wake = self.next_watch
+                for spec in self.streams:
+                    if spec.thread is None and spec.state == "backoff":
+                        next_wake = min(next_wake, spec.next_start)
+                self.wakeup = False
+                self.cond.wait_for(lambda: self.wakeup or self.stopping or self.node.conn_generation != generation,
+                                   max(0, next_wake - monotonic()))
+
+    def read_stream(self, spec):
+        started = monotonic()
+        error = "stream ended"
+        try:
+            if spec.on_start is not None:
+                spec.on_start()
+            call = self.node.invoker.stream(spec.method, spec.request())
+            with self.cond:
+                spec.call = call
+                if self.stopping:
+                    call.cancel()
+                self.set_state(spec, "running")
+            for response in self.node.invoker.iterate(spec.method, call):
+                spec.messages += 1
+                try:
+                    spec.handle(response)
+                except Exception as e:
+                    # failure to handle one message doesn't tear down stream
+                    logToFile("Exception LiveFeed LocalNode " + spec.name + " handler: " + str(e))
+        except Exception as e:
+            error = str(e)
+
+        with self.cond:
+            spec.call = None
+            spec.thread = None
+            if self.stopping:
+                self.set_state(spec, "stopped")
+                return
+            if monotonic() - started >= self.stable_after:
+                spec.failures = 0
+            delay = self.backoff_delay(spec.failures)
+            spec.failures += 1
+            spec.restarts += 1
+            spec.last_error = error
+            spec.next_start = monotonic() + delay
+            self.set_state(spec, "backoff")
+            self.wakeup = True
+            self.cond.notify_all()
+        logToFile("LiveFeed LocalNode " + spec.name + ": stream lost (" + error + "), restart in " + str(int(delay)) + " seconds")
+
+    def get_states(self):
+        with self.cond:
+            now = monotonic()
+            states = []
+            for spec in self.streams:
+                states.append({
+                    "name": spec.name,
+                    "state": spec.state,
+                    "since": int(now - spec.state_since),
+                    "restarts": spec.restarts,
+                    "messages": spec.messages,
+                    "last_error": spec.last_error,
+                    "next_start": int(max(0, spec.next_start - now)) if spec.state == "backoff" else 0
+                })
+            return states
@@ -17,12 +17,6 @@ class Plot:
         self.channels = ln_channels
         self.node_info = node_info
 
-    def get_capacity_pct(self):
-        for idx, ch in enumerate(self.channels):
-            total = int(ch["local_balance"]) + int(ch["remote_balance"])
-            self.channels[idx]["local_balance_pct"] = int(round((int(ch["local_balance"]) / total) * 100))
-            self.channels[idx]["remote_balance_pct"] = int(round((int(ch["remote_balance"]) / total) * 100))
-
     def plot_cap_dist(self, plot_type):
         try:
             image_name = str(uuid.uuid4().hex) + ".png"
@@ -42,10 +36,9 @@ class Plot:
             if plot_type not in ["cdbar", "cdscatter"]:
                 plot_type = "cdbar"
 
-            self.get_capacity_pct()
             hist_local = [0] * 101
             for ch in self.channels:
-                hist_local[ch["local_balance_pct"]] += 1
+                hist_local[ch.local_balance_pct] += 1
 
             fig = plt.figure(figsize=(19.2, 10.8))
             ax = plt.gca()
@@ -14,7 +14,9 @@ import re
 from pyzbar.pyzbar import decode
 from PIL import Image
 from userdata import UserData
-from base64 import b64decode
+from io import BytesIO
+from html import escape
+from datetime import datetime, timezone
 
 
 def restricted(func):
@@ -45,6 +47,9 @@ class Bot:
     root_dir = os.path.dirname(os.path.abspath(__file__))
     config_file_path = os.path.join(root_dir, "private", "btcnodebot.conf")
     access_whitelist_user = []
+    admin_users = []
+    digest_windows = [0, 60, 300, 900, 3600]  # seconds, 0 = every payment is sent right away
+    max_document_size = 256 * 1024
 
     def __init__(self):
         self.updater = None
@@ -60,6 +65,7 @@ class Bot:
         self.config = parse_config(self.config_file_path)
         self.otp_enabled = self.config["bototp"]
         self.access_whitelist_user = self.config["botwhitelist"]
+        self.admin_users = self.config["botadmins"]
 
         if self.config["bottoken"] == "":
             logToFile("No bot token found in btcnodebot.conf. Please use @BotFather to create telegram bot and acquire token.")
@@ -81,6 +87,8 @@ class Bot:
         self.dispatcher.add_handler(msghandler)
         imagehandler = MessageHandler(Filters.photo, self.image_handle)
         self.dispatcher.add_handler(imagehandler)
+        documenthandler = MessageHandler(Filters.document, self.document_handle)
+        self.dispatcher.add_handler(documenthandler)
         callbackqhandler = CallbackQueryHandler(self.callback_handle)
         self.dispatcher.add_handler(callbackqhandler)
 
@@ -98,8 +106,12 @@ class Bot:
         self.dispatcher.add_handler(backup_handler)
         generate_backup_handler = CommandHandler('generate_backup', self.generate_backup)
         self.dispatcher.add_handler(generate_backup_handler)
+        backup_archive_handler = CommandHandler('backup_archive', self.backup_archive)
+        self.dispatcher.add_handler(backup_archive_handler)
         walletCancelPayHandler = CommandHandler('cancel_payment', self.cancelPayment)
         self.dispatcher.add_handler(walletCancelPayHandler)
+        walletCancelBatchPayHandler = CommandHandler('cancel_batch_payment', self.cancelBatchPayment)
+        self.dispatcher.add_handler(walletCancelBatchPayHandler)
         walletOnchainAddressHandler = CommandHandler('onchain_addr', self.walletOnchainAddress)
         self.dispatcher.add_handler(walletOnchainAddressHandler)
         walletOnchainSendHandler = CommandHandler('onchain_send', self.walletOnchainSend)
@@ -120,6 +132,12 @@ class Bot:
         self.dispatcher.add_handler(walletCancelOpenChHandler)
         walletCancelCloseChHandler = CommandHandler('cancel_channel_closing', self.cancelClosingChannel)
         self.dispatcher.add_handler(walletCancelCloseChHandler)
+        rpcStatsHandler = CommandHandler('rpc_stats', self.rpcStats)
+        self.dispatcher.add_handler(rpcStatsHandler)
+        streamsHandler = CommandHandler('streams', self.streamStates)
+        self.dispatcher.add_handler(streamsHandler)
+        latencyHandler = CommandHandler('latency', self.latencyStats)
+        self.dispatcher.add_handler(latencyHandler)
 
         if self.otp_enabled is True:
             # generate new 2fA secret if doesn't exist
@@ -146,6 +164,10 @@ class Bot:
     def stop(self):
         if self.updater is not None:
             self.updater.stop()
+        if hasattr(self, "LNwallet"):
+            self.LNwallet.stop()
+        if hasattr(self, "userdata"):
+            self.userdata.stop()  # write pending userdata changes
         logToFile("stopped")
 
     # ------------------------------- Keyboard Menus
@@ -164,6 +186,10 @@ class Bot:
             state4 = "  ✔" if notif_state["chevents"] else ""
             button_list.append(InlineKeyboardButton("Channel Events (new opened, closed)"+state4, callback_data="notif_chevents"))
 
+        digest_window = self.userdata.get_invoice_digest_window(username)
+        digest_state = "  " + str(digest_window // 60) + " min" if digest_window > 0 else "  off"
+        button_list.append(InlineKeyboardButton("Received LN payments digest" + digest_state, callback_data="notifdigest_cycle"))
+
         notif_menu = build_menu(button_list, n_cols=1)
         return InlineKeyboardMarkup(notif_menu)
 
@@ -268,8 +294,8 @@ class Bot:
         button_list = []
 
         for ch in channels["channels"]:
-            button_header = ch["alias"] + " Cap: " + formatAmount(int(ch["capacity"]), self.userdata.get_selected_unit(username))
-            button = InlineKeyboardButton(button_header, callback_data="ch_"+ch["chan_id"])
+            button_header = ch.alias + " Cap: " + formatAmount(ch.capacity, self.userdata.get_selected_unit(username))
+            button = InlineKeyboardButton(button_header, callback_data="ch_"+str(ch.chan_id))
             button_list.append(button)
 
         if channels["last"] is False and page > 0:
@@ -335,9 +361,10 @@ class Bot:
         invoice_data = self.userdata.get_wallet_payinvoice(username)
         if invoice_data is not None:
             raw_pay_req = invoice_data["raw_invoice"]
+            payment_hash = invoice_data["decoded"]["payment_hash"]
             paythread = threading.Thread(
                 target=self.LNwallet.payInvoice,
-                args=[raw_pay_req, self.updater.bot, chat_id, username, code_otp],
+                args=[raw_pay_req, payment_hash, self.updater.bot, chat_id, username, code_otp],
                 daemon=True
             )
             paythread.start()
@@ -347,6 +374,37 @@ class Bot:
         self.userdata.set_wallet_payinvoice(username, None)
         self.userdata.set_conv_state(username, None)
 
+    def executeBatchPayment(self, username, chat_id, code_otp=""):
+        invoices = self.userdata.get_wallet_batch_invoices(username)
+        if invoices is not None and len(invoices) > 0:
+            paythread = threading.Thread(
+                target=self.LNwallet.payInvoiceBatch,
+                args=[invoices, self.updater.bot, chat_id, username, code_otp],
+                daemon=True
+            )
+            paythread.start()
+        else:
+            self.updater.bot.send_message(chat_id=chat_id, text="You don't have any invoices to pay.")
+
+        self.userdata.set_wallet_batch_invoices(username, None)
+        self.userdata.set_conv_state(username, None)
+
+    def reviewInvoiceBatch(self, username, chat_id, pay_reqs):
+        self.updater.bot.send_chat_action(chat_id=chat_id, action=telegram.ChatAction.TYPING)
+        valid, invalid = self.LNwallet.decodeInvoiceBatch(pay_reqs)
+        msgtext = self.LNwallet.formatInvoiceBatch(valid, invalid, username)
+        if len(valid) == 0:
+            self.updater.bot.send_message(chat_id=chat_id, text=msgtext + "\nThere is nothing I can pay.", parse_mode=telegram.ParseMode.HTML)
+            return
+
+        self.userdata.set_wallet_batch_invoices(username, valid)
+        if self.otp_enabled:
+            self.userdata.set_conv_state(username, "paybatch_otp")
+            self.updater.bot.send_message(chat_id=chat_id, text=msgtext + "\n<i>send me 2FA code for payments or</i> /cancel_batch_payment", parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
+        else:
+            self.updater.bot.send_message(chat_id=chat_id, text=msgtext, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
+            self.updater.bot.send_message(chat_id=chat_id, text="Do you want to pay " + str(len(valid)) + " invoices?", reply_markup=self.confirm_menu("paybatch"))
+
     def addInvoice(self, username, chat_id):
         try:
             self.updater.bot.send_chat_action(chat_id=chat_id, action=telegram.ChatAction.TYPING)
@@ -420,6 +478,13 @@ class Bot:
                 self.userdata.toggle_notifications_state(username, param[1])
                 bot.send_message(chat_id=query.message.chat_id, text="Notifications settings updated.", reply_markup=self.notif_menu(username))
 
+            elif param[0] == "notifdigest":
+                # cycle through digest windows
+                digest_window = self.userdata.get_invoice_digest_window(username)
+                idx = self.digest_windows.index(digest_window) if digest_window in self.digest_windows else 0
+                self.userdata.set_invoice_digest_window(username, self.digest_windows[(idx + 1) % len(self.digest_windows)])
+                bot.send_message(chat_id=query.message.chat_id, text="Notifications settings updated.", reply_markup=self.notif_menu(username))
+
             elif param[0] == "backup":
                 self.userdata.toggle_backups_state(username, param[1])
                 bot.send_message(chat_id=query.message.chat_id, text="Backup settings updated.", reply_markup=self.backup_menu(username))
@@ -432,6 +497,12 @@ class Bot:
                 elif param[1] == "no":
                     self.cancelPayment(bot, update)
 
+            elif param[0] == "paybatch":
+                if param[1] == "yes":
+                    self.executeBatchPayment(username, query.message.chat_id)
+                elif param[1] == "no":
+                    self.cancelBatchPayment(bot, update)
+
             elif param[0] == "addinvoice":
                 if param[1] == "amt":
                     self.userdata.set_conv_state(username, "createInvoice_amount")
@@ -500,7 +571,7 @@ class Bot:
                         bot.send_message(chat_id=query.message.chat_id, text="Cannot get channel data, " + err)
                     else:
                         formated = self.LNwallet.formatChannelOutput(ch_data, username)
-                        bot.send_message(chat_id=query.message.chat_id, text=formated, reply_markup=self.close_channel_button(ch_data["chan_id"]), parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
+                        bot.send_message(chat_id=query.message.chat_id, text=formated, reply_markup=self.close_channel_button(str(ch_data.chan_id)), parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=True)
                     page = self.userdata.get_pagination(username)
                     self.getChannelsPage(username, query.message.chat_id, page)
 
@@ -768,6 +839,13 @@ class Bot:
                 bot.send_message(chat_id=msg.chat_id, text="This is not 2FA code. Please send 6-digit code or /cancel_payment")
             return
 
+        if conv_state == "paybatch_otp":
+            if re.fullmatch("[0-9]{6}", cmd) is not None:
+                self.executeBatchPayment(msg.from_user.username, msg.chat_id, code_otp=cmd)
+            else:
+                bot.send_message(chat_id=msg.chat_id, text="This is not 2FA code. Please send 6-digit code or /cancel_batch_payment")
+            return
+
         if conv_state == "openChannel_otp":
             if re.fullmatch("[0-9]{6}", cmd) is not None:
                 self.executeOpeningChannel(msg.from_user.username, msg.chat_id, code_otp=cmd)
@@ -789,6 +867,11 @@ class Bot:
                 bot.send_message(chat_id=msg.chat_id, text="This is not 2FA code. Please send 6-digit code or /cancel_transaction")
             return
 
+        pay_reqs = self.LNwallet.extractInvoices(cmd)
+        if len(pay_reqs) > 1:  # multiple LN invoices are paid as batch
+            self.reviewInvoiceBatch(username, msg.chat_id, pay_reqs)
+            return
+
         if cmd.lower()[:4] in ["lnbc", "lntb", "lnbcrt"] or cmd.lower()[:10] == "lightning:":  # LN invoice
             value, isValid = self.LNwallet.decodeInvoice(cmd, qr=False)  # isValid = True means it is valid LN invoice
             if isValid:
@@ -916,6 +999,30 @@ class Bot:
         else:
             bot.send_message(chat_id=msg.chat_id, text="I'm sorry " + value + ".🙀")
 
+    @restricted
+    def document_handle(self, bot, update):
+        msg = update["message"]
+        username = msg.from_user.username
+        if msg.document.file_size is not None and msg.document.file_size > self.max_document_size:
+            bot.send_message(chat_id=msg.chat_id, text="File is too big, I can read invoices from text files up to " + str(self.max_document_size // 1024) + " KB.")
+            return
+
+        # download file
+        newFile = bot.get_file(msg.document.file_id)
+        temp_path_local = os.path.join(self.root_dir, "temp", str(uuid.uuid4().hex) + ".txt")
+        newFile.download(temp_path_local)
+        try:
+            with open(temp_path_local, "r", errors="ignore") as file:
+                pay_reqs = self.LNwallet.extractInvoices(file.read(self.max_document_size))
+        finally:
+            if os.path.exists(temp_path_local):
+                os.remove(temp_path_local)
+
+        if len(pay_reqs) == 0:
+            bot.send_message(chat_id=msg.chat_id, text="I couldn't find any lightning invoice in this file.")
+            return
+        self.reviewInvoiceBatch(username, msg.chat_id, pay_reqs)
+
     # ------------------------------- Command handlers
     @restricted
     def start(self, bot, update):
@@ -927,10 +1034,11 @@ class Bot:
         text = "<b>Command List</b>\n"
         for c in self.commands:
             # ignore unsupported commands
-            if ln_version["major"] == 0 and ln_version["minor"] < 6 and any(subs in c for subs in ["backups", "generate_backup"]):
+            if ln_version["major"] == 0 and ln_version["minor"] < 6 and any(subs in c for subs in ["backups", "generate_backup", "backup_archive"]):
                 continue
             text += "/" + c
         text += "\n\nTo pay LN invoice just send picture of a QR code or directly paste invoice text in chat."
+        text += "\nTo pay several invoices at once paste them in one message or send them as a text file."
         bot.send_message(chat_id=msg.chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
 
     @restricted
@@ -976,16 +1084,43 @@ class Bot:
             bot.send_message(chat_id=msg.chat_id, text="I couldn't generate backup, there was an error.")
             return
 
-        multi_ch_bytes = b64decode(response["multi_chan_backup"]["multi_chan_backup"])
-        temp_path_local = os.path.join(self.root_dir, "temp", "manual_channel.backup")
-        with open(temp_path_local, "wb") as file:
-            file.write(multi_ch_bytes)
-
-        bot.send_document(chat_id=msg.chat_id, document=open(temp_path_local, "rb"), parse_mode=telegram.ParseMode.HTML,
+        bot.send_document(chat_id=msg.chat_id, document=BytesIO(response.multi_chan_backup), parse_mode=telegram.ParseMode.HTML,
                           caption="<b>Multi Channel Backup</b>", filename="channel.backup")
 
-        if os.path.exists(temp_path_local):
-            os.remove(temp_path_local)
+    @restricted
+    def backup_archive(self, bot, update):
+        msg = update["message"]
+        entries, error = self.LNwallet.getBackupArchive()
+        if error is not None:
+            bot.send_message(chat_id=msg.chat_id, text="Backup archive is not enabled, it is kept when scb_on_disk is enabled.")
+            return
+        if len(entries) == 0:
+            bot.send_message(chat_id=msg.chat_id, text="Backup archive is empty.")
+            return
+
+        params = msg.text.split(' ')
+        if len(params) > 1:
+            # send selected backup
+            try:
+                entry = entries[int(params[1]) - 1]
+            except (ValueError, IndexError):
+                bot.send_message(chat_id=msg.chat_id, text="Backup number not valid.")
+                return
+            backup_bytes, error = self.LNwallet.getArchivedBackup(entry["file"])
+            if error is not None:
+                bot.send_message(chat_id=msg.chat_id, text="I couldn't read backup from archive, there was an error.")
+                return
+            date = datetime.fromtimestamp(entry["time"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+            bot.send_document(chat_id=msg.chat_id, document=BytesIO(backup_bytes), parse_mode=telegram.ParseMode.HTML,
+                              caption="<b>Multi Channel Backup</b>\n" + date + ", " + str(entry["channels"]) + " channels", filename="channel.backup")
+            return
+
+        text = "<b>Archived Multi Channel Backups</b>\n"
+        for idx, entry in enumerate(entries[:30]):
+            date = datetime.fromtimestamp(entry["time"], timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+            text += str(idx + 1) + ". " + date + ", " + str(entry["channels"]) + " channels, " + str(entry["size"]) + " bytes\n"
+        text += "\nTo get backup send /backup_archive &lt;number&gt;"
+        bot.send_message(chat_id=msg.chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
 
     @restricted
     def createInvoice(self, bot, update):
@@ -1015,6 +1150,25 @@ class Bot:
         else:
             bot.send_message(chat_id=chat_id, text="You don't have any invoice to cancel.")
 
+    @restricted
+    def cancelBatchPayment(self, bot, update):
+        if update["message"] is not None:  # command execution
+            msg = update["message"]
+            username = msg.from_user.username
+            chat_id = msg.chat_id
+        else:  # call from callback handler
+            username = update.effective_user.username
+            chat_id = update.callback_query.message.chat_id
+
+        self.userdata.set_conv_state(username, None)
+        invoices = self.userdata.get_wallet_batch_invoices(username)
+        if invoices is not None:
+            total = sum(int(data["decoded"]["num_satoshis"]) for data in invoices)
+            self.userdata.set_wallet_batch_invoices(username, None)
+            bot.send_message(chat_id=chat_id, text="Batch payment of " + str(len(invoices)) + " invoices (" + formatAmount(total, self.userdata.get_selected_unit(username)) + ") cancelled.")
+        else:
+            bot.send_message(chat_id=chat_id, text="You don't have any invoices to cancel.")
+
     @restricted
     def cancelClosingChannel(self, bot, update):
         if update["message"] is not None:  # command execution
@@ -1142,6 +1296,60 @@ class Bot:
         msg = update["message"]
         bot.send_message(chat_id=msg.chat_id, text="Select plot type.", reply_markup=self.plot_stats_menu())
 
+    @restricted
+    def rpcStats(self, bot, update):
+        msg = update["message"]
+        lines = self.LNwallet.getRpcStats()
+        if len(lines) == 0:
+            bot.send_message(chat_id=msg.chat_id, text="No RPC calls yet.")
+            return
+        bot.send_message(chat_id=msg.chat_id, text="<b>lnd RPC statistics</b>\n" + "\n".join(lines), parse_mode=telegram.ParseMode.HTML)
+
+    @restricted
+    def streamStates(self, bot, update):
+        msg = update["message"]
+        text = "<b>lnd subscriptions</b>\n"
+        for stream in self.LNwallet.getStreamStates():
+            text += stream["name"] + ": " + stream["state"] + " for " + str(stream["since"]) + "s, messages " + str(stream["messages"]) \
+                    + ", restarts " + str(stream["restarts"])
+            if stream["state"] == "backoff":
+                text += ", next try in " + str(stream["next_start"]) + "s"
+            if stream["last_error"] != "":
+                text += "\nlast error: " + escape(stream["last_error"][:200])
+            text += "\n"
+        stats = self.LNwallet.getDispatchStats()
+        text += "\n<b>Notification queue</b>\n" + "depth " + str(stats["depth"]) + " (max " + str(stats["max_depth"]) + "), queued " + str(stats["queued"]) \
+                + ", sent " + str(stats["sent"]) + ", failed " + str(stats["failed"]) + ", blocked " + str(stats["blocked"]) \
+                + "\nretried " + str(stats["retried"]) + ", waiting for retry " + str(stats["retry_pending"]) \
+                + "\nrate limited " + str(stats["retry_after"]) + " times, throttled " + str(int(stats["throttled_sec"])) + "s"
+        if stats["paused_sec"] > 0:
+            text += ", paused for " + str(stats["paused_sec"]) + "s"
+        text += "\n\n<b>Event consumers</b>\n"
+        for name, consumer in self.LNwallet.getEventStats().items():
+            text += name + ": depth " + str(consumer["depth"]) + " (max " + str(consumer["max_depth"]) + "), handled " + str(consumer["handled"]) \
+                    + ", failed " + str(consumer["failed"]) + ", dropped " + str(consumer["dropped"]) + ", blocked " + str(consumer["blocked"]) + "\n"
+        bot.send_message(chat_id=msg.chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
+
+    @restricted
+    def latencyStats(self, bot, update):
+        msg = update["message"]
+        if msg.from_user.username not in self.admin_users:
+            bot.send_message(chat_id=msg.chat_id, text="This command is available to bot admins only (botadmins in btcnodebot.conf).")
+            return
+        stats = self.LNwallet.getLatencyStats()
+        text = "<b>Notification latency</b> (last 15 min, from lnd event)\n"
+        if len(stats["events"]) == 0:
+            text += "no notifications sent\n"
+        for event_type, stages in stats["events"].items():
+            text += "\n<b>" + event_type + "</b>\n"
+            for stage in ["render", "send"]:
+                if stage in stages:
+                    s = stages[stage]
+                    text += stage + ": p50 " + "{:.2f}".format(s["p50"]) + "s, p90 " + "{:.2f}".format(s["p90"]) + "s, p99 " \
+                            + "{:.2f}".format(s["p99"]) + "s, max " + "{:.2f}".format(s["max"]) + "s (" + str(s["count"]) + ")\n"
+        text += "\nQueue depth at render: avg " + "{:.1f}".format(stats["depth"]["avg"]) + ", max " + str(stats["depth"]["max"])
+        bot.send_message(chat_id=msg.chat_id, text=text, parse_mode=telegram.ParseMode.HTML)
+
 if __name__ == "__main__":
     btcnodebot = Bot()
     btcnodebot.run()
@@ -1,6 +1,15 @@
 import os
 import json
 import copy
+from threading import Lock, Thread, Condition
+from time import monotonic
+import atexit
+from collections import namedtuple
+from helper import logToFile
+
+
+# notification recipient with preferences used when rendering notifications
+Recipient = namedtuple("Recipient", ["username", "chat_id", "unit", "explorer", "search_link", "digest_window"])
 
 
 class UserData:
@@ -10,8 +19,10 @@ class UserData:
     default_data = {
         "wallet": {
             "invoice": None,
+            "batch_invoices": None,
             "notifications": {"node": True, "transactions": True, "invoices": True, "chevents": True},
-            "backups": {"chatscb": True, "last_scb_backup_msg_id": None, "last_scb_backup_file_id": None, "last_scb_backup_chan_points": []},
+            "invoice_digest_window": 0,
+            "backups": {"chatscb": True, "last_scb_backup_msg_id": None, "last_scb_backup_file_id": None, "last_scb_backup_hash": None},
             "default_explorer_tx": "https://blockstream.info/tx/",
             "default_node_search_link": "https://1ml.com/node/",
             "selected_unit": "sats",
@@ -24,9 +35,22 @@ class UserData:
         "conversation_state": None,
         "pagination_number": -1
     }
+    notification_types = ["node", "transactions", "invoices", "chevents", "chatscb"]
+    # changes are written by background thread once no change came for save_delay seconds, but at most
+    # save_max_delay seconds after first unsaved change, with write_behind disabled every change is written right away
+    write_behind = True
+    save_delay = 2
+    save_max_delay = 10
 
     def __init__(self, whitelist):
         self.access_whitelist_user = whitelist
+        self.save_cond = Condition()
+        self.dirty_since = None  # monotonic time of first unsaved change
+        self.last_change = 0
+        self.retry_at = 0  # earliest time of next write after failed one
+        self.stopping = False
+        self.save_requests = 0
+        self.writes = 0
         userdata_file = os.path.join(self.root_dir, "private", "userdata.json")
         if not os.path.exists(userdata_file):
             with open(userdata_file, 'w') as file:
@@ -42,9 +66,21 @@ class UserData:
         # set default data for users not yet in userdata
         for user in self.access_whitelist_user:
             if user not in self.data:
-                self.data[user] = self.default_data
+                self.data[user] = copy.deepcopy(self.default_data)
         # save back changes
-        self.save_userdata()
+        self.write_userdata()
+        self.save_thread = None
+        if self.write_behind:
+            self.save_thread = Thread(target=self.run_saver, daemon=True)
+            self.save_thread.start()
+            atexit.register(self.stop)
+
+        # subscribers of each notification type, kept up to date by setters so notifications don't walk userdata
+        self.subscribers_lock = Lock()
+        self.subscribers = {key: {} for key in self.notification_types}  # key -> username -> Recipient
+        self.subscriber_lists = {key: () for key in self.notification_types}  # published copy, safe to iterate
+        for username in self.data:
+            self.update_subscriber(username)
 
     def sync_data_changes(self, default_data, user_data):
         self.data_sync_remove(default_data, user_data)  # remove keys from user_data that are no longer in default_data
@@ -74,16 +110,88 @@ class UserData:
                     user_data[key] = copy.deepcopy(value)
 
     def save_userdata(self):
-        with open(os.path.join(self.root_dir, "private", "userdata.json"), "w") as file:
-            json.dump(self.data, file)
+        # mark data changed, file is written later by saver thread
+        with self.save_cond:
+            self.save_requests += 1
+            if not self.write_behind or self.stopping:
+                self.write_userdata()
+                return
+            now = monotonic()
+            self.last_change = now
+            if self.dirty_since is None:
+                self.dirty_since = now
+                self.save_cond.notify()
+
+    def write_userdata(self):
+        # must be called with save_cond held (or from constructor), file is replaced atomically
+        userdata_file = os.path.join(self.root_dir, "private", "userdata.json")
+        temp_file = userdata_file + ".tmp"
+        with open(temp_file, "w") as file:
+            file.write(json.dumps(self.data))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, userdata_file)
+        self.writes += 1
+        self.dirty_since = None
+
+    def run_saver(self):
+        with self.save_cond:
+            while not self.stopping:
+                if self.dirty_since is None:
+                    self.save_cond.wait()
+                    continue
+                due = max(min(self.last_change + self.save_delay, self.dirty_since + self.save_max_delay), self.retry_at)
+                if monotonic() < due:
+                    self.save_cond.wait(due - monotonic())
+                    continue
+                try:
+                    self.write_userdata()
+                except Exception as e:
+                    logToFile("Exception UserData save: " + str(e))
+                    self.retry_at = monotonic() + self.save_max_delay
+
+    def flush(self):
+        # write pending changes now
+        with self.save_cond:
+            if self.dirty_since is not None:
+                self.write_userdata()
+
+    def stop(self):
+        # flush pending changes, later changes are written right away, called from atexit so it never raises
+        with self.save_cond:
+            self.stopping = True
+            self.save_cond.notify()
+            if self.dirty_since is not None:
+                try:
+                    self.write_userdata()
+                except Exception as e:
+                    logToFile("Exception UserData stop: " + str(e))
+
+    def update_subscriber(self, username):
+        # refresh entries of one user in subscriber lists
+        with self.subscribers_lock:
+            user = self.data.get(username)
+            active = user is not None and user["chat_id"] is not None and username in self.access_whitelist_user
+            for key, members in self.subscribers.items():
+                was_member = members.pop(username, None) is not None
+                if active:
+                    wallet = user["wallet"]
+                    enabled = wallet["backups"]["chatscb"] if key == "chatscb" else wallet["notifications"][key]
+                    if enabled is True:
+                        members[username] = Recipient(username, user["chat_id"], wallet["selected_unit"], wallet["default_explorer_tx"],
+                                                      wallet["default_node_search_link"], wallet["invoice_digest_window"])
+                if was_member or username in members:
+                    self.subscriber_lists[key] = tuple(members.values())
 
     def add_new_user(self, username):
-        self.data[username] = self.default_data
+        self.data[username] = copy.deepcopy(self.default_data)
         self.save_userdata()
+        self.update_subscriber(username)
 
     def remove_user(self, username):
         self.data.pop(username, None)
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_usernames(self):
         return self.access_whitelist_user
@@ -95,35 +203,52 @@ class UserData:
     def get_wallet_payinvoice(self, username):
         return self.data[username]["wallet"]["invoice"]
 
+    def set_wallet_batch_invoices(self, username, invoices):
+        self.data[username]["wallet"]["batch_invoices"] = invoices
+        self.save_userdata()
+
+    def get_wallet_batch_invoices(self, username):
+        return self.data[username]["wallet"]["batch_invoices"]
+
     def toggle_notifications_state(self, username, key):
         self.data[username]["wallet"]["notifications"][key] = not self.data[username]["wallet"]["notifications"][key]
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_notifications_state(self, username):
         return self.data[username]["wallet"]["notifications"]
 
+    def get_notification_recipients(self, key):
+        # users with chat_id that have notification type enabled
+        return self.subscriber_lists[key]
+
+    def set_invoice_digest_window(self, username, seconds):
+        self.data[username]["wallet"]["invoice_digest_window"] = seconds
+        self.save_userdata()
+        self.update_subscriber(username)
+
+    def get_invoice_digest_window(self, username):
+        return self.data[username]["wallet"]["invoice_digest_window"]
+
     def toggle_backups_state(self, username, key):
         self.data[username]["wallet"]["backups"][key] = not self.data[username]["wallet"]["backups"][key]
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_backups_state(self, username):
         return self.data[username]["wallet"]["backups"]
 
-    def set_last_scb_backup_msg_id(self, username, msg_id):
-        self.data[username]["wallet"]["backups"]["last_scb_backup_msg_id"] = msg_id
-        self.save_userdata()
-
-    def set_last_scb_backup_file_id(self, username, file_id):
-        self.data[username]["wallet"]["backups"]["last_scb_backup_file_id"] = file_id
-        self.save_userdata()
-
-    def set_last_scb_backup_chan_points(self, username, chan_points):
-        self.data[username]["wallet"]["backups"]["last_scb_backup_chan_points"] = copy.deepcopy(chan_points)
+    def set_last_scb_backup(self, username, msg_id, file_id, backup_hash):
+        backups = self.data[username]["wallet"]["backups"]
+        backups["last_scb_backup_msg_id"] = msg_id
+        backups["last_scb_backup_file_id"] = file_id
+        backups["last_scb_backup_hash"] = backup_hash
         self.save_userdata()
 
     def set_chat_id(self, username, chat_id):
         self.data[username]["chat_id"] = chat_id
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_chat_id(self, username):
         return self.data[username]["chat_id"]
@@ -149,6 +274,7 @@ class UserData:
     def set_default_explorer(self, username, explorer_link):
         self.data[username]["wallet"]["default_explorer_tx"] = explorer_link
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_default_explorer(self, username):
         return self.data[username]["wallet"]["default_explorer_tx"]
@@ -156,6 +282,7 @@ class UserData:
     def set_default_node_search_link(self, username, search_link):
         self.data[username]["wallet"]["default_node_search_link"] = search_link
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_default_node_search_link(self, username):
         return self.data[username]["wallet"]["default_node_search_link"]
@@ -195,6 +322,7 @@ class UserData:
     def set_selected_unit(self, username, unit):
         self.data[username]["wallet"]["selected_unit"] = unit
         self.save_userdata()
+        self.update_subscriber(username)
 
     def get_onchain_send_data(self, username):
         return self.data[username]["wallet"]["onchain_send_data"]
@@ -4,12 +4,15 @@ import os
 from helper import logToFile, formatAmount
 from datetime import timedelta, datetime, timezone
 from node.local_node import LocalNode
+from node import bolt11
 import pyotp
 import threading
-from time import sleep
 import telegram
 from base64 import b64decode
 from plot import Plot
+import re
+from html import escape
+from time import monotonic
 
 
 class Wallet:
@@ -25,11 +28,15 @@ class Wallet:
         "1ml.com": "https://1ml.com/node/"
     }
 
+    invoice_regex = re.compile(r"(?:lightning:)?(ln(?:bcrt|bc|tb)[0-9a-z]+)", re.IGNORECASE)
+    max_batch_invoices = 50
+    max_batch_lines_length = 3000  # telegram messages are limited to 4096 characters, rest of text needs some room
+    batch_edit_interval = 2  # seconds between edits of batch result message
+
     def __init__(self, bot, userdata, config):
         self.bot = bot
         self.enable_otp = config["bototp"]
         self.userdata = userdata
-        self.threadList = []
         self.node = LocalNode(config=config, bot=bot, userdata=userdata)
         self.subscribe_notifications()
 
@@ -40,18 +47,22 @@ class Wallet:
         return self.lnNodeSearchLink
 
     def subscribe_notifications(self):
-        subscriptions = [
-            self.node.subscribe_node_watcher,
-            self.node.subscribe_invoices,
-            self.node.subscribe_transactions,
-            self.node.subscribe_channel_events,
-            self.node.subscribe_channel_backups
-        ]
-        for subscription in subscriptions:
-            t = threading.Thread(target=subscription, daemon=True)
-            self.threadList.append(t)
-            t.start()
-            sleep(0.1)
+        self.node.start_subscriptions()
+
+    def getStreamStates(self):
+        return self.node.get_stream_states()
+
+    def getDispatchStats(self):
+        return self.node.get_dispatch_stats()
+
+    def getEventStats(self):
+        return self.node.get_event_stats()
+
+    def getLatencyStats(self):
+        return self.node.get_latency_stats()
+
+    def stop(self):
+        self.node.stop()
 
     def check_backups_updated(self):
         t = threading.Thread(target=self.node.update_channel_backups, daemon=True)
@@ -60,6 +71,9 @@ class Wallet:
     def ln_node_version(self):
         return self.node.ln_version
 
+    def getRpcStats(self):
+        return self.node.get_rpc_stats()
+
     def check_otp(self, code):
         if self.enable_otp is False:
             return True
@@ -87,8 +101,9 @@ class Wallet:
 
             decoded_data, error = self.node.decode_ln_invoice(pay_req=text)
             if error is None:
-                info_data, error_info = self.node.get_ln_node_info(pub_key=decoded_data["destination"])  # get destination node info, alias...
-                ret_data = {"decoded": decoded_data, "destination_node": info_data, "raw_invoice": text}
+                # alias cache is warmed from channel graph, preview doesn't wait for node lookups
+                alias = self.node.get_node_alias(decoded_data["destination"], cached_only=True)
+                ret_data = {"decoded": decoded_data, "destination_alias": alias, "raw_invoice": text}
                 return ret_data, True
             return "this is not valid invoice", False
 
@@ -96,16 +111,70 @@ class Wallet:
             logToFile("Exception at decoding invoice input data: "+str(e))
             return "there was error at decoding", False
 
+    def extractInvoices(self, text):
+        # all invoices found in text, duplicates removed, order kept
+        pay_reqs = []
+        for match in self.invoice_regex.finditer(text):
+            pay_req = match.group(1)
+            if pay_req.lower() not in [p.lower() for p in pay_reqs]:
+                pay_reqs.append(pay_req)
+        return pay_reqs
+
+    def decodeInvoiceBatch(self, pay_reqs):
+        # decode concurrently, returns list of valid invoices and list of invoices that can't be paid in batch
+        valid = []
+        invalid = []
+        results = self.node.rpc_pool.map(lambda pay_req: self.decodeInvoice(pay_req, qr=False), pay_reqs[:self.max_batch_invoices])
+        for pay_req, (value, isValid) in zip(pay_reqs, results):
+            if not isValid:
+                invalid.append({"raw_invoice": pay_req, "error": value})
+            elif int(value["decoded"]["num_satoshis"]) == 0:
+                invalid.append({"raw_invoice": pay_req, "error": "invoice without amount"})
+            elif bolt11.seconds_to_expiry(value["decoded"]) <= 0:
+                invalid.append({"raw_invoice": pay_req, "error": "invoice expired"})
+            elif value["decoded"]["payment_hash"] in [v["decoded"]["payment_hash"] for v in valid]:
+                invalid.append({"raw_invoice": pay_req, "error": "duplicate invoice"})
+            else:
+                valid.append(value)
+        for pay_req in pay_reqs[self.max_batch_invoices:]:
+            invalid.append({"raw_invoice": pay_req, "error": "more than " + str(self.max_batch_invoices) + " invoices in batch"})
+        return valid, invalid
+
+    def formatInvoiceBatch(self, valid, invalid, username):
+        unit = self.userdata.get_selected_unit(username)
+        total = 0
+        lines = []
+        for idx, data in enumerate(valid):
+            amount = int(data["decoded"]["num_satoshis"])
+            total += amount
+            to = data["destination_alias"] or data["decoded"]["destination"][:16]
+            line = str(idx + 1) + ". " + formatAmount(amount, unit) + " to " + escape(to[:32])
+            if data["decoded"]["description"] != "":
+                line += ", " + escape(data["decoded"]["description"][:40])
+            lines.append(line)
+        text = "<b>Lightning invoices: </b>\n" + self.joinLimitedLines(lines, self.max_batch_lines_length * 2 // 3)
+        text += "<b>Total: " + formatAmount(total, unit) + "</b>\n"
+        if len(invalid) > 0:
+            lines = [data["raw_invoice"][:20] + "... " + escape(data["error"][:100]) for data in invalid]
+            text += "\n<b>Skipped:</b>\n" + self.joinLimitedLines(lines, self.max_batch_lines_length // 3)
+        return text
+
+    def joinLimitedLines(self, lines, max_length):
+        # lines that don't fit into max_length are left out and only counted
+        text = ""
+        for idx, line in enumerate(lines):
+            if len(text) + len(line) + 1 > max_length:
+                return text + "... and " + str(len(lines) - idx) + " more\n"
+            text += line + "\n"
+        return text
+
     def formatDecodedInvoice(self, data, username, lb_symbol="\n"):
 
         d_time = datetime.fromtimestamp(int(data["decoded"]["timestamp"]), timezone.utc)
         expiry = int(data["decoded"]["expiry"])
         d_time_expiration = d_time + timedelta(seconds=expiry)
 
-        if data["destination_node"] and data["destination_node"]["node"]["alias"] != "":
-            to = data["destination_node"]["node"]["alias"]
-        else:
-            to = data["decoded"]["destination"]
+        to = data["destination_alias"] or data["decoded"]["destination"]
         unit = self.userdata.get_selected_unit(username)
         searchEngineLink = self.userdata.get_default_node_search_link(username)
 
@@ -115,40 +184,116 @@ class Wallet:
             + "Expiration: " + d_time_expiration.strftime('%c %Z') + lb_symbol \
             + "Description: " + data["decoded"]["description"] + lb_symbol
 
-    def payInvoice(self, pay_req, bot, chat_id, username, otp_code=""):
+    def payInvoice(self, pay_req, payment_hash, bot, chat_id, username, otp_code=""):
         sending_msg = bot.send_message(chat_id=chat_id, text="Sending payment...")
         try:
             if self.check_otp(otp_code) is False:
                 bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoice, 2FA code not valid.")
                 return
 
-            out_json, error = self.node.pay_ln_invoice(pay_req)
-            if error is None:
-                if out_json["payment_error"] != "":
-                    bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoice, " + str(out_json["payment_error"]))
+            done = threading.Event()  # progress callbacks can race with the final result
+
+            def on_progress(state, position):
+                if done.is_set():
                     return
+                if state == "queued":
+                    text = "Payment queued, " + str(position) + " payment(s) ahead..."
+                elif state == "unknown":
+                    text = "Payment status unknown, node rejected one of payments in progress, waiting for result..."
                 else:
-                    total_amt = out_json["payment_route"]["total_amt"]
-                    num_hops = len(out_json["payment_route"]["hops"])
-                    if "total_fees_msat" in out_json["payment_route"]:
-                        total_fees = out_json["payment_route"]["total_fees_msat"]
-                    else:
-                        total_fees = 0
-                    unit = self.userdata.get_selected_unit(username)
-                    msg_text = "<b>Invoice has been paid.</b>\n" \
-                               + "Total amount: " + formatAmount(int(total_amt), unit) + "\n" \
-                               + "Total fees: " + "{:,}".format(int(total_fees)).replace(',', '.') + " msats\n" \
-                               + "hops: " + str(num_hops) + "\n"
-
-                    bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text=msg_text, parse_mode=telegram.ParseMode.HTML)
-                    return
+                    text = "Sending payment, searching for route..."
+                bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text=text)
+
+            def on_done(result, error):
+                done.set()
+                if error is None and result["payment_error"] == "":
+                    bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text=self.formatPaymentResult(result, error, username),
+                                          parse_mode=telegram.ParseMode.HTML)
+                else:
+                    bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text=self.formatPaymentResult(result, error, username))
 
-            bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoice, " + str(error))
+            self.node.pay_ln_invoice(pay_req, payment_hash, on_progress, on_done)
         except Exception as e:
             text = str(e)
             logToFile("Exception payInvoice wallet: " + text)
             bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoice, there was an error.")
 
+    def formatPaymentResult(self, result, error, username):
+        if error is not None:
+            return "I couldn't pay invoice, " + str(error)
+        if result["payment_error"] != "":
+            return "I couldn't pay invoice, " + str(result["payment_error"])
+
+        unit = self.userdata.get_selected_unit(username)
+        return "<b>Invoice has been paid.</b>\n" \
+               + "Total amount: " + formatAmount(int(result["total_amt"]), unit) + "\n" \
+               + "Total fees: " + "{:,}".format(int(result["total_fees_msat"])).replace(',', '.') + " msats\n" \
+               + "hops: " + str(result["num_hops"]) + "\n"
+
+    def payInvoiceBatch(self, invoices, bot, chat_id, username, otp_code=""):
+        sending_msg = bot.send_message(chat_id=chat_id, text="Sending " + str(len(invoices)) + " payments...")
+        try:
+            if self.check_otp(otp_code) is False:
+                bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoices, 2FA code not valid.")
+                return
+
+            results = [None] * len(invoices)
+            lock = threading.Lock()
+            last_edit = [0.0]
+
+            def on_progress(state, position):
+                pass
+
+            def on_done(idx, result, error):
+                with lock:
+                    results[idx] = (result, error)
+                    finished = all(r is not None for r in results)
+                    # telegram limits edits, intermediate results are shown at most every few seconds
+                    if not finished and monotonic() - last_edit[0] < self.batch_edit_interval:
+                        return
+                    last_edit[0] = monotonic()
+                    text = self.formatBatchResult(invoices, results, username)
+                    bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text=text, parse_mode=telegram.ParseMode.HTML)
+
+            # engine limits number of payments in flight, rest wait in its queue
+            for idx, data in enumerate(invoices):
+                if bolt11.seconds_to_expiry(data["decoded"]) < self.node.payment_expiry_margin:
+                    on_done(idx, None, "invoice expired")  # expired while waiting for confirmation
+                    continue
+                self.node.pay_ln_invoice(data["raw_invoice"], data["decoded"]["payment_hash"], on_progress,
+                                         lambda result, error, idx=idx: on_done(idx, result, error))
+        except Exception as e:
+            text = str(e)
+            logToFile("Exception payInvoiceBatch wallet: " + text)
+            bot.edit_message_text(chat_id=chat_id, message_id=sending_msg.message_id, text="I couldn't pay invoices, there was an error.")
+
+    def formatBatchResult(self, invoices, results, username):
+        unit = self.userdata.get_selected_unit(username)
+        paid = 0
+        paid_amount = 0
+        fees = 0
+        lines = []
+        for idx, data in enumerate(invoices):
+            line = str(idx + 1) + ". " + formatAmount(int(data["decoded"]["num_satoshis"]), unit) + " "
+            if results[idx] is None:
+                line += "sending..."
+            else:
+                result, error = results[idx]
+                if error is None and result["payment_error"] == "":
+                    paid += 1
+                    paid_amount += int(result["total_amt"])
+                    fees += int(result["total_fees_msat"])
+                    line += "paid, fee " + "{:,}".format(int(result["total_fees_msat"])).replace(',', '.') + " msats"
+                else:
+                    line += "failed, " + escape(str(error if error is not None else result["payment_error"])[:100])
+            lines.append(line)
+
+        done = all(r is not None for r in results)
+        text = "<b>Batch payment " + ("finished" if done else "in progress") + "</b>\n" + self.joinLimitedLines(lines, self.max_batch_lines_length)
+        text += "\nPaid " + str(paid) + "/" + str(len(invoices)) + ", total amount: " + formatAmount(paid_amount, unit) \
+                + ", total fees: " + "{:,}".format(fees).replace(',', '.') + " msats\n"
+        return text
+
     def addInvoice(self, memo="", value=0, expiry=3600):
         return self.node.add_ln_invoice(value, memo, expiry)
 
@@ -158,6 +303,12 @@ class Wallet:
     def getMultiChannelBackup(self):
         return self.node.export_all_channel_backups()
 
+    def getBackupArchive(self):
+        return self.node.get_backup_archive()
+
+    def getArchivedBackup(self, file_name):
+        return self.node.read_archived_backup(file_name)
+
     def getChannels(self, page=-1, per_page=-1):
         channels, err = self.node.get_channel_list()
         if err is not None:
@@ -174,13 +325,8 @@ class Wallet:
             while i < per_page:
                 if (start + i) >= num_of_channels:
                     return None, "no more pages."
-                ch_data = channels["channels"][i+start]
-                info_data, error_info = self.node.get_ln_node_info(pub_key=ch_data["remote_pubkey"])
-                if info_data is None:
-                    alias = ch_data["remote_pubkey"][:12]
-                else:
-                    alias = info_data["node"]["alias"]
-                ch_data["alias"] = alias
+                ch_data = channels["channels"][i+start].copy()  # copy, channel list is shared snapshot
+                ch_data.alias = self.node.get_node_alias(ch_data.remote_pubkey) or ch_data.remote_pubkey[:12]
                 response["channels"].append(ch_data)
                 i += 1
                 if (start + i) >= num_of_channels:
@@ -194,25 +340,16 @@ class Wallet:
             return None, text
 
     def getChannelData(self, chan_id):
-        channels, err = self.node.get_channel_list()
+        ch, err = self.node.get_channel(chan_id)
         if err is not None:
             return None, err
+        if ch is None:
+            return None, "channel not found."
 
         try:
-            for ch in channels["channels"]:
-                if ch["chan_id"] == chan_id:
-                    info_data, error_info = self.node.get_ln_node_info(pub_key=ch["remote_pubkey"])
-                    if info_data is None:
-                        ch["alias"] = ch["remote_pubkey"][:12]
-                    else:
-                        ch["alias"] = info_data["node"]["alias"]
-
-                    # add calculated ch balance pct
-                    total = int(ch["local_balance"]) + int(ch["remote_balance"])
-                    ch["local_balance_pct"] = int(round((int(ch["local_balance"]) / total) * 100))
-                    ch["remote_balance_pct"] = int(round((int(ch["remote_balance"]) / total) * 100))
-                    return ch, None
-            return None, "channel not found."
+            ch = ch.copy()  # copy, channel is part of shared snapshot
+            ch.alias = self.node.get_node_alias(ch.remote_pubkey) or ch.remote_pubkey[:12]
+            return ch, None
         except Exception as e:
             text = str(e)
             logToFile("Exception getChannelData: " + text)
@@ -266,9 +403,9 @@ class Wallet:
                 bot.edit_message_text(chat_id=chat_id, message_id=msg.message_id, text="I couldn't close channel, " + error)
                 return
 
-            force = False if ch["active"] else True
+            force = False if ch.active else True
 
-            response, error_close = self.node.close_channel(ch["channel_point"], target_conf, sat_per_byte, force)
+            response, error_close = self.node.close_channel(ch.channel_point, target_conf, sat_per_byte, force)
             if error_close is not None:
                 bot.edit_message_text(chat_id=chat_id, message_id=msg.message_id, text="I couldn't close channel, " + error_close)
                 return
@@ -277,7 +414,7 @@ class Wallet:
             commit_txid_bytes = b64decode(response["close_pending"]["txid"])[:: -1]  # decode base64 and reverse bytes
             commit_txid = commit_txid_bytes.hex()  # bytes to hex string
             close_type = "force " if force else ""
-            info = str(ch["csv_delay"]) + " blocks, for funds to be available." if force else "for commitment tx confirmation."
+            info = str(ch.csv_delay) + " blocks, for funds to be available." if force else "for commitment tx confirmation."
             msg_text = "<b>Channel successfully " + close_type + "closed.</b>\n" \
                        + "Please wait " + info + "\n" \
                        + "Commitment Tx: <a href='" + explorerLink + commit_txid + "'>" + commit_txid[:8] + "..." + commit_txid[-8:] + "</a>"
@@ -330,9 +467,12 @@ class Wallet:
                     "onchain_total": response["onchain"]["total_balance"],
                     "onchain_confirmed": response["onchain"]["confirmed_balance"],
                     "onchain_unconfirmed": response["onchain"]["unconfirmed_balance"],
-                    "num_channels": len(response["ln"]["channels"]),
+                    "num_channels": len(response["ln"].channels),
                     "num_active": 0,
                     "num_private": 0,
+                    "num_pending": 0,
+                    "pending_open": int(response["ln_balance"]["pending_open_balance"]),
+                    "pending_close": int(response["pending"]["total_limbo_balance"]),
                     "channels": {
                         "effective_outbound_capacity": 0,
                         "effective_inbound_capacity": 0,
@@ -343,25 +483,29 @@ class Wallet:
                     }
                 }
                 num_active = 0
-                for channel in response["ln"]["channels"]:
-                    balance["channels"]["outbound_capacity"] += int(channel["local_balance"])
-                    balance["channels"]["inbound_capacity"] += int(channel["remote_balance"])
+                for channel in response["ln"].channels:
+                    balance["channels"]["outbound_capacity"] += channel.local_balance
+                    balance["channels"]["inbound_capacity"] += channel.remote_balance
 
-                    if channel["private"]:
+                    if channel.private:
                         balance["num_private"] += 1
 
-                    if channel["active"]:
+                    if channel.active:
                         num_active += 1
-                        balance["channels"]["effective_outbound_capacity"] += int(channel["local_balance"])
-                        balance["channels"]["effective_inbound_capacity"] += int(channel["remote_balance"])
+                        balance["channels"]["effective_outbound_capacity"] += channel.local_balance
+                        balance["channels"]["effective_inbound_capacity"] += channel.remote_balance
+
+                # peers with at least one inactive channel, from snapshot's peer index
+                for pubkey, channels in response["ln"].by_remote_pubkey.items():
+                    if not all(channel.active for channel in channels):
+                        balance["channels"]["inactive_pubkeys"].append(pubkey)
+
+                aliases = self.node.get_node_aliases(balance["channels"]["inactive_pubkeys"])
+                for pubkey in balance["channels"]["inactive_pubkeys"]:
+                    balance["channels"]["inactive_aliases"].append(aliases[pubkey] or pubkey[:12])
 
-                    elif channel["remote_pubkey"] not in balance["channels"]["inactive_pubkeys"]:
-                        balance["channels"]["inactive_pubkeys"].append(channel["remote_pubkey"])
-                        info_data, error_info = self.node.get_ln_node_info(pub_key=channel["remote_pubkey"])
-                        if info_data is None or info_data["node"]["alias"] == "":
-                            balance["channels"]["inactive_aliases"].append(channel["remote_pubkey"][:12])
-                        else:
-                            balance["channels"]["inactive_aliases"].append(info_data["node"]["alias"])
+                for key in ["pending_open_channels", "pending_closing_channels", "pending_force_closing_channels", "waiting_close_channels"]:
+                    balance["num_pending"] += len(response["pending"][key])
 
                 balance["num_active"] = num_active
                 return balance, None
@@ -416,6 +560,15 @@ class Wallet:
                 + "<i>--Inactive remote nodes</i>" + lb_symbol \
                 + ", ".join(inactive_links)
 
+        if data["num_pending"] > 0:
+            idx = len(args)
+            args.append(data["pending_open"])
+            args.append(data["pending_close"])
+            text += lb_symbol \
+                + "<i>--Pending channels: " + str(data["num_pending"]) + "</i>" + lb_symbol \
+                + "Opening: {" + str(idx) + "}" + lb_symbol \
+                + "Closing: {" + str(idx + 1) + "}"
+
         unit = self.userdata.get_selected_unit(username)
         for idx, arg in enumerate(args):
             args[idx] = formatAmount(arg, unit)
@@ -424,28 +577,28 @@ class Wallet:
         return text
 
     def formatChannelOutput(self, data, username, lb_symbol="\n"):
-        active_text = "" if data["active"] else "  🔴 <i>offline</i>"
-        private_text = "private" if data["private"] else "public"
-        fund_txid = data["channel_point"][:data["channel_point"].find(':')]
+        active_text = "" if data.active else "  🔴 <i>offline</i>"
+        private_text = "private" if data.private else "public"
+        fund_txid = data.channel_point[:data.channel_point.find(':')]
         explorerLink = self.userdata.get_default_explorer(username)
         funding_link = "<a href='" + explorerLink + fund_txid + "'>" + fund_txid[:8] + "..." + fund_txid[-8:] + "</a>"
         searchEngineLink = self.userdata.get_default_node_search_link(username)
 
-        text = "<b>" + data["alias"] + "</b>" + active_text + lb_symbol \
-            + "<a href='" + searchEngineLink + data["remote_pubkey"] + "'>" + data["remote_pubkey"] + "</a>" + lb_symbol \
+        text = "<b>" + data.alias + "</b>" + active_text + lb_symbol \
+            + "<a href='" + searchEngineLink + data.remote_pubkey + "'>" + data.remote_pubkey + "</a>" + lb_symbol \
             + "Capacity: {0}" + lb_symbol \
-            + "Local Balance: {1} ("+str(data["local_balance_pct"])+"%)" + lb_symbol \
-            + "Remote Balance: {2} ("+str(data["remote_balance_pct"])+"%)" + lb_symbol \
-            + "Time Lock: " + str(data["csv_delay"]) + lb_symbol \
-            + "Number of Updates: " + data["num_updates"] + lb_symbol \
+            + "Local Balance: {1} ("+str(data.local_balance_pct)+"%)" + lb_symbol \
+            + "Remote Balance: {2} ("+str(data.remote_balance_pct)+"%)" + lb_symbol \
+            + "Time Lock: " + str(data.csv_delay) + lb_symbol \
+            + "Number of Updates: " + str(data.num_updates) + lb_symbol \
             + "Total Sent: {3}" + lb_symbol \
             + "Total Received: {4}" + lb_symbol \
             + "Type: " + private_text + lb_symbol \
             + "Funding Tx: " + funding_link
 
         args = [
-            int(data["local_balance"])+int(data["remote_balance"]), int(data["local_balance"]), int(data["remote_balance"]), int(data["total_satoshis_sent"]),
-            int(data["total_satoshis_received"])
+            data.local_balance + data.remote_balance, data.local_balance, data.remote_balance, data.total_satoshis_sent,
+            data.total_satoshis_received
         ]
 
         unit = self.userdata.get_selected_unit(username)
@@ -500,23 +653,22 @@ class Wallet:
         return text
 
     def formatChannelCloseOutput(self, data, closing_data, username, lb_symbol="\n"):
-        active_text = "" if data["active"] else "  🔴 <i>offline</i>"
+        active_text = "" if data.active else "  🔴 <i>offline</i>"
         target_conf = closing_data["target_conf"] if closing_data["target_conf"] > 0 else "/"
         fee = closing_data["sat_per_byte"] if closing_data["sat_per_byte"] > 0 else "/"
         searchEngineLink = self.userdata.get_default_node_search_link(username)
 
-        text = "<b>" + data["alias"] + "</b>" + active_text + lb_symbol \
-               + "<a href='" + searchEngineLink + data["remote_pubkey"] + "'>" + data["remote_pubkey"] + "</a>" + lb_symbol \
+        text = "<b>" + data.alias + "</b>" + active_text + lb_symbol \
+               + "<a href='" + searchEngineLink + data.remote_pubkey + "'>" + data.remote_pubkey + "</a>" + lb_symbol \
                + "Capacity: {0}" + lb_symbol \
-               + "Local Balance: {1} ("+str(data["local_balance_pct"])+"%)" + lb_symbol \
-               + "Remote Balance: {2} ("+str(data["remote_balance_pct"])+"%)" + lb_symbol + lb_symbol \
+               + "Local Balance: {1} ("+str(data.local_balance_pct)+"%)" + lb_symbol \
+               + "Remote Balance: {2} ("+str(data.remote_balance_pct)+"%)" + lb_symbol + lb_symbol \
                + "Commitment transaction: " + lb_symbol \
                + "Target Conf: " + str(target_conf) + lb_symbol \
                + "Fees(sat/byte): " + str(fee)
 
         args = [
-            int(data["local_balance"]) + int(data["remote_balance"]), int(data["local_balance"]),
-            int(data["remote_balance"])
+            data.local_balance + data.remote_balance, data.local_balance, data.remote_balance
         ]
 
         unit = self.userdata.get_selected_unit(username)